@@ -0,0 +1,153 @@
+# =======================================================
+# Server-side AP model renderer (static SVG with cached stage fragments)
+# =======================================================
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from data_model import AP_MODEL_STRUCTURE
+
+STAGE_WIDTH = 700
+CANVAS_HEIGHT = 680
+NODE_RADIUS = 70
+NODE_COLORS = {
+    "Avant-garde Social Issues": "#ff9999",
+    "People's Values": "#ecba13",
+    "Social Issues": "#ffff99",
+    "Technology and Resources": "#99cc99",
+    "Daily Spaces and User Experience": "#99cccc",
+    "Institutions": "#9999ff",
+}
+# Top-left corner of each node; odd stages are mirrored vertically so inter-stage arrows stay short
+_EVEN_LAYOUT = {
+    "Institutions": (355, 50), "Daily Spaces and User Experience": (180, 270), "Social Issues": (530, 270),
+    "Technology and Resources": (50, 500), "Avant-garde Social Issues": (355, 500), "People's Values": (660, 500),
+}
+_ODD_LAYOUT = {
+    "Technology and Resources": (50, 50), "Avant-garde Social Issues": (355, 50), "People's Values": (660, 50),
+    "Daily Spaces and User Experience": (180, 270), "Social Issues": (530, 270), "Institutions": (355, 500),
+}
+# Arrows that point into the next stage's object instead of their own stage's target
+INTER_STAGE_TARGETS = {
+    "Organization": "Technology and Resources",
+    "Standardization": "Technology and Resources",
+    "Meaning Attribution": "Daily Spaces and User Experience",
+    "Habituation": "Institutions",
+}
+DOTTED_ARROWS = {"Art (Social Criticism)", "Media"}
+CACHE_SIZE = 256
+
+def node_center(index: int, object_name: str) -> tuple:
+    x, y = (_EVEN_LAYOUT if index % 2 == 0 else _ODD_LAYOUT)[object_name]
+    return index * STAGE_WIDTH + x + NODE_RADIUS, y + NODE_RADIUS
+
+def canvas_width(num_stages: int) -> int:
+    return (num_stages - 1) * STAGE_WIDTH + 820
+
+def model_digest(ap_model) -> str:
+    return hashlib.sha1(ap_model.to_json().encode("utf-8")).hexdigest()
+
+def _tooltip(item) -> str:
+    text = item.definition + (f"\n\n[Example] {item.example}" if item.example else "")
+    return f"<title>{escape(text)}</title>"
+
+def _wrap(label: str, width: int = 14) -> list:
+    lines, line = [], ""
+    for word in label.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line]
+
+def _node_svg(index: int, node, tooltips: bool) -> str:
+    cx, cy = node_center(index, node.type)
+    lines = _wrap(node.type)
+    top = cy - (len(lines) - 1) * 8
+    tspans = "".join(f'<tspan x="{cx}" y="{top + i * 16}">{escape(line)}</tspan>' for i, line in enumerate(lines))
+    return (f'<g class="node">{_tooltip(node) if tooltips else ""}<circle cx="{cx}" cy="{cy}" r="{NODE_RADIUS - 2}" fill="{NODE_COLORS[node.type]}" stroke="#fff" stroke-width="3"/>'
+            f'<text text-anchor="middle" dominant-baseline="middle" font-size="13" font-weight="bold">{tspans}</text></g>')
+
+def _arrow_svg(start: tuple, end: tuple, arrow, tooltips: bool) -> str:
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    dist = math.hypot(dx, dy) or 1.0
+    ux, uy = dx / dist, dy / dist
+    x1, y1 = start[0] + ux * NODE_RADIUS, start[1] + uy * NODE_RADIUS
+    x2, y2 = end[0] - ux * (NODE_RADIUS + 2), end[1] - uy * (NODE_RADIUS + 2)
+    mx, my = (x1 + x2) / 2, (y1 + y2) / 2
+    dash = ' stroke-dasharray="3 3"' if arrow.type in DOTTED_ARROWS else ""
+    label_width = 6 * len(arrow.type) + 16
+    return (f'<g class="arrow">{_tooltip(arrow) if tooltips else ""}<line x1="{x1:.0f}" y1="{y1:.0f}" x2="{x2:.0f}" y2="{y2:.0f}" stroke="#333" stroke-width="2"{dash} marker-end="url(#head)"/>'
+            f'<rect x="{mx - label_width / 2:.0f}" y="{my - 9:.0f}" width="{label_width}" height="18" rx="9" fill="#fff" stroke="#ddd"/>'
+            f'<text x="{mx:.0f}" y="{my:.0f}" text-anchor="middle" dominant-baseline="central" font-size="10">{escape(arrow.type)}</text></g>')
+
+def _render_stage(index: int, stage: int, ap_model, next_objects: frozenset, tooltips: bool) -> str:
+    """Nodes and arrows of one stage; `next_objects` is None for the last rendered stage"""
+    parts = [f'<text x="{index * STAGE_WIDTH + 20}" y="24" font-size="15" font-weight="bold" fill="#555">Stage {stage}</text>']
+    drawn = {name for name in ap_model.nodes if name in _EVEN_LAYOUT}
+    edges = []
+    for name, arrow in ap_model.arrows.items():
+        info = AP_MODEL_STRUCTURE["arrows"].get(name, {"from": arrow.source, "to": arrow.target})
+        if info["from"] not in drawn:
+            continue
+        if name in INTER_STAGE_TARGETS:
+            # The last stage has no next stage to point into, so these arrows are hidden there
+            if next_objects is None: continue
+            if INTER_STAGE_TARGETS[name] in next_objects:
+                edges.append(_arrow_svg(node_center(index, info["from"]), node_center(index + 1, INTER_STAGE_TARGETS[name]), arrow, tooltips))
+                continue
+        if info["to"] in drawn:
+            edges.append(_arrow_svg(node_center(index, info["from"]), node_center(index, info["to"]), arrow, tooltips))
+    nodes = [_node_svg(index, node, tooltips) for name, node in ap_model.nodes.items() if name in drawn]
+    # Arrows first so the nodes and labels are drawn on top
+    return "".join(parts + edges + nodes)
+
+class _LRUCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        value = build()
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+        return value
+
+_fragments = _LRUCache(CACHE_SIZE)
+_documents = _LRUCache(CACHE_SIZE)
+
+def render_ap_timeline_svg(ap_history: list, tooltips: bool = True) -> str:
+    """Render StageRecords left to right as one SVG document, reusing cached per-stage fragments.
+
+    Each fragment is cached by its position, the hash of its AP model and the objects
+    present in the following stage, so a rerun with an unchanged history costs only hashing.
+    """
+    digests = [model_digest(record.ap_model) for record in ap_history]
+    keys = []
+    for i, record in enumerate(ap_history):
+        next_objects = frozenset(ap_history[i + 1].ap_model.nodes) if i + 1 < len(ap_history) else None
+        keys.append((i, record.stage, digests[i], next_objects, tooltips))
+
+    def build_document():
+        fragments = [_fragments.get_or_build(key, lambda record=record, key=key: _render_stage(key[0], record.stage, record.ap_model, key[3], tooltips))
+                     for record, key in zip(ap_history, keys)]
+        width = canvas_width(len(ap_history))
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{CANVAS_HEIGHT}" viewBox="0 0 {width} {CANVAS_HEIGHT}" font-family="sans-serif">'
+                '<defs><marker id="head" markerWidth="8" markerHeight="8" refX="7" refY="4" orient="auto"><path d="M0,0 L8,4 L0,8 z" fill="#333"/></marker></defs>'
+                f'<rect width="100%" height="100%" fill="#fafafa"/>{"".join(fragments)}</svg>')
+
+    return _documents.get_or_build(tuple(keys), build_document)
+
+def render_ap_timeline_html(ap_history: list, tooltips: bool = True) -> str:
+    """SVG wrapped in a horizontally scrollable container for embedding in a page"""
+    return f'<div style={quoteattr("overflow-x:auto;border:1px solid #ddd;border-radius:10px;background:white;")}>{render_ap_timeline_svg(ap_history, tooltips)}</div>'
@@ -2,19 +2,32 @@
 # Enhanced SF Generator - Demonstration Specialized Version (Auto-Execution)
 # =======================================================
 import streamlit as st
+import concurrent.futures
 import json
 import re
 import time
-from openai import OpenAI
-from tavily import TavilyClient
-import concurrent.futures
+import uuid
+from templates import SYSTEM_PROMPT
+from ap_renderer import render_ap_timeline_html, render_ap_timeline_svg
+from telemetry import chat_completion, web_search
+from estimator import estimate_run
+from knowledge_base import REFRESH_ENABLED, BackgroundRefresher, Stage1KnowledgeBase
+from scheduler import scheduler
+from monitor import monitor
+from data_model import (AP_MODEL_STRUCTURE, CORE_ELEMENTS, DEFAULT_NUM_STAGES, MAX_NUM_STAGES, NUM_ITERATIONS,
+                        find_affected_arrows, APModel, APNode, APArrow, StageRecord, Proposal, Judgment, FinalDecision,
+                        IterationRecord, ElementResult, TranscriptStore, compact_json, history_to_dicts, selected_contents)
 
 # ========== Page Setup ==========
+run_started = time.perf_counter()
 st.set_page_config(page_title="Near-Future SF Generator", layout="wide")
 
 # ========== Client Initialization ==========
 def initialize_clients(openai_api_key=None):
     """Initialize OpenAI and Tavily clients"""
+    # Imported on first use so the input screen renders without loading the SDKs
+    from openai import OpenAI
+    from tavily import TavilyClient
     try:
         # Use user-provided key if available, otherwise fall back to secrets
         if openai_api_key:
@@ -29,67 +42,6 @@ def initialize_clients(openai_api_key=None):
     except Exception as e:
         return None, None, str(e)
 
-# ========== System Prompt & Constants ==========
-SYSTEM_PROMPT = """You are a science fiction expert who analyzes society based on the "Archaeological Prototyping (AP)" model. Here is an introduction to this model:
-
-AP is a sociocultural model consisting of 18 items (6 objects and 12 arrows). In essence, it is a model that divides society and culture into 18 elements around a specific theme and logically describes their connections.
-
-This model can also be considered as a directed graph. It consists of 6 objects (Avant-garde Social Issues, People's Values, Social Issues, Technology and Resources, Daily Spaces and User Experience, Institutions) and 12 arrows (Media, Community Formation, Cultural Arts Promotion, Standardization, Communication, Organization, Meaning Attribution, Products/Services, Habituation, Paradigm, Business Ecosystem, Art (Social Criticism)) that constitute a generational sociocultural model. The connections between these objects and arrows are defined as follows:
-
-##Objects
-1. Avant-garde Social Issues: Social issues caused by paradigms of technology and resources, or social issues that emerge through Art (Social Criticism) regarding daily living spaces and user experiences within them.
-2. People's Values: The desired state of people who empathize with avant-garde social issues spread through cultural arts promotion or social issues that cannot be addressed by institutions spread through daily communication. These issues are not recognized by everyone, but only by certain progressive/minority people. Specifically, this includes macro environmental issues (climate, ecology, etc.) and human environmental issues (ethics, economics, hygiene, etc.).
-3. Social Issues: Social issues recognized by society through progressive communities addressing avant-garde issues, or social issues constrained by institutions exposed through media. These emerge as targets that should be solved in society.
-4. Technology and Resources: Among the institutions created to smoothly function daily routines, these are technologies and resources that are standardized and constrained by the past, and technologies and resources possessed by organizations (for-profit and non-profit corporations, including groups without legal status, regardless of new or existing) organized to solve social issues.
-5. Daily Spaces and User Experience: Physical spaces composed of products and services developed by mobilizing technology and resources, and user experiences of using those products and services with meaning attribution based on certain values in those spaces. The relationship between values and user experience is, for example, people with the value "want to become an AI engineer" give meaning to PCs as "tools for learning programming" and have the experience of "programming."
-6. Institutions: Institutions created to more smoothly carry out habits that people with certain values perform daily, or institutions created by stakeholders (business ecosystem) who conduct business composing daily spaces and user experiences to conduct business more smoothly. Specifically, this includes laws, guidelines, industry standards, administrative guidance, and morals.
-
-##Arrows
-1. Media: Media that reveals contemporary institutional defects. Includes major media such as mass media and internet media, as well as individuals who disseminate information. Converts institutions to social issues. (Institutions -> Social Issues)
-2. Community Formation: Communities formed by people who recognize avant-garde issues. Whether official or unofficial does not matter. Converts avant-garde social issues to social issues. (Avant-garde Social Issues -> Social Issues)
-3. Cultural Arts Promotion: Activities that exhibit and convey social issues revealed by Art (Social Criticism) as works to people. Converts avant-garde social issues to people's values. (Avant-garde Social Issues -> People's Values)
-4. Standardization: Among institutions, standardization of institutions conducted to affect a broader range of stakeholders. Converts institutions to new technology and resources. (Institutions -> Technology and Resources)
-5. Communication: Communication means to convey social issues to more people. For example, this is often done through SNS in recent years. Converts social issues to people's values. (Social Issues -> People's Values)
-6. Organization: Organizations formed to solve social issues. Regardless of whether they have legal status or are new or old organizations, all organizations that address newly emerged social issues. Converts social issues to new technology and resources. (Social Issues -> Technology and Resources)
-7. Meaning Attribution: Reasons why people use products and services based on their values. Converts people's values to new daily spaces and user experiences. (People's Values -> Daily Spaces and User Experience)
-8. Products/Services: Products and services created using technology and resources possessed by organizations. Converts technology and resources to daily spaces and user experiences. (Technology and Resources -> Daily Spaces and User Experience)
-9. Habituation: Habits that people perform based on their values. Converts people's values to institutions. (People's Values -> Institutions)
-10. Paradigm: As dominant technology and resources of an era, these bring influence to the next generation. Converts technology and resources to avant-garde social issues. (Technology and Resources -> Avant-garde Social Issues)
-11. Business Ecosystem: Networks formed by stakeholders related to products and services that compose daily spaces and user experiences to maintain them. Converts daily spaces and user experiences to institutions. (Daily Spaces and User Experience -> Institutions)
-12. Art (Social Criticism): Beliefs of people who view issues that people don't notice from subjective/intrinsic perspectives. Has the role of feeling discomfort with daily spaces and user experiences and presenting issues. Converts daily spaces and user experiences to avant-garde social issues. (Daily Spaces and User Experience -> Avant-garde Social Issues)
-
-###The S-curve is a model representing the evolution of technology over time. It consists of the following three stages:
-##Stage 1: Ferment Period: In this stage, technological development progresses steadily, but its progress is gradual. Focus is mainly on solving existing problems and improving current functions. At the end of this period, current problems are solved while new problems emerge.
-##Stage 2: Take-off Period: In this stage, technology enters a rapid growth period. Various innovative ideas are proposed, and they eventually combine to create completely new forms of technology. At the end of this period, technology achieves great development while also causing new problems.
-##Stage 3: Maturity Period: In this stage, technological development becomes gradual again. While solving problems that occurred in the previous period, technology evolves into a more stable and mature state.
-"""
-
-AP_MODEL_STRUCTURE = {
-    "objects": {
-        "Avant-garde Social Issues": "Social issues caused by paradigms of technology and resources",
-        "People's Values": "Values and ideals recognized by progressive people",
-        "Social Issues": "Issues recognized and to be solved in society",
-        "Technology and Resources": "Technology and resources organized for problem solving",
-        "Daily Spaces and User Experience": "Physical spaces and user experiences through products/services",
-        "Institutions": "Systems and rules that facilitate habits and business"
-    },
-    "arrows": {
-        "Media": {"from": "Institutions", "to": "Social Issues", "description": "Media exposing institutional defects"},
-        "Community Formation": {"from": "Avant-garde Social Issues", "to": "Social Issues", "description": "Communities addressing avant-garde issues"},
-        "Cultural Arts Promotion": {"from": "Avant-garde Social Issues", "to": "People's Values", "description": "Exhibition and transmission of issues through art"},
-        "Standardization": {"from": "Institutions", "to": "Technology and Resources", "description": "Standardization of institutions into technology/resources"},
-        "Communication": {"from": "Social Issues", "to": "People's Values", "description": "Issue transmission via SNS etc."},
-        "Organization": {"from": "Social Issues", "to": "Technology and Resources", "description": "Formation of organizations for problem solving"},
-        "Meaning Attribution": {"from": "People's Values", "to": "Daily Spaces and User Experience", "description": "Reasons for using products/services based on values"},
-        "Products/Services": {"from": "Technology and Resources", "to": "Daily Spaces and User Experience", "description": "Creation of products/services using technology"},
-        "Habituation": {"from": "People's Values", "to": "Institutions", "description": "Institutionalization of habits based on values"},
-        "Paradigm": {"from": "Technology and Resources", "to": "Avant-garde Social Issues", "description": "New social issues from dominant technology"},
-        "Business Ecosystem": {"from": "Daily Spaces and User Experience", "to": "Institutions", "description": "Networks of business stakeholders"},
-        "Art (Social Criticism)": {"from": "Daily Spaces and User Experience", "to": "Avant-garde Social Issues", "description": "Presenting issues from discomfort with daily life"}
-    }
-}
-
-
 # ========== Helper Functions ==========
 def parse_json_response(gpt_output: str) -> dict:
     result_str = gpt_output.strip()
@@ -104,6 +56,16 @@ def parse_json_response(gpt_output: str) -> dict:
         st.error(f"String attempted to parse: {result_str}")
         raise e
 
+# Seconds a session waiting for admission sleeps before asking the scheduler again
+ADMISSION_POLL_SECONDS = 2
+
+def report_backlog(status_container, session_id: str):
+    """Tell the user when their calls are waiting for a free scheduler worker"""
+    # Right after submit the tasks are queued even on an idle server until a worker picks them up
+    waiting = scheduler.queued(session_id) if scheduler.saturated() else 0
+    if waiting:
+        status_container.write(f"  - Server busy: {waiting} of your requests are waiting for a free worker ({scheduler.queued()} queued in total)...")
+
 # ========== Stage 1: Tavily Functions ==========
 def generate_question_for_object(client, product: str, object_name: str, object_description: str) -> str:
     prompt = f"""
@@ -114,7 +76,7 @@ The question should meet the following conditions:
 - A question that would likely yield good results in a search engine
 Output only the question:
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0)
+    response = chat_completion(client, "object_question", model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0)
     return response.choices[0].message.content.strip()
 
 def generate_question_for_arrow(client, product: str, arrow_name: str, arrow_info: dict) -> str:
@@ -130,12 +92,12 @@ The question should meet the following conditions:
 - A question that can discover specific cases or relationships in {product}
 Output only the question:
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0)
+    response = chat_completion(client, "arrow_question", model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0)
     return response.choices[0].message.content.strip()
 
 def search_and_get_answer(tavily_client, question: str) -> str:
     try:
-        response = tavily_client.search(query=question, include_answer=True)
+        response = web_search(tavily_client, "search", query=question, include_answer=True)
         answer = response.get('answer', '')
         if answer: return answer
         results = response.get('results', [])
@@ -159,7 +121,7 @@ Output in the following JSON format:
 {{"source": "{arrow_info['from']}", "target": "{arrow_info['to']}", "type": "{element_name}", "definition": "Specific explanation of transformation relationship (within 30 characters)", "example": "Specific example related to this arrow"}}
 """
     try:
-        response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}], response_format={"type": "json_object"})
+        response = chat_completion(client, "stage1_element", model="gpt-4o", messages=[{"role": "user", "content": prompt}], response_format={"type": "json_object"})
         return json.loads(response.choices[0].message.content.strip())
     except Exception: return None
 
@@ -180,34 +142,86 @@ def process_element(client, tavily_client, product: str, element_type: str, name
         st.warning(f"Error occurred while processing element '{name}': {e}")
         return None, None
 
-def build_stage1_ap_with_tavily(client, tavily_client, product: str, status_container):
+def build_stage1_ap_with_tavily(client, tavily_client, product: str, status_container, session_id: str, knowledge_base: Stage1KnowledgeBase = None):
+    if knowledge_base:
+        hit = knowledge_base.get(product)
+        if hit:
+            matched_topic, introduction, cached_model = hit
+            status_container.write(f"Loaded Stage 1 analysis of '{matched_topic}' from the knowledge base.")
+            return introduction, cached_model
     ap_model = {"nodes": [], "arrows": []}
     all_answers = []
-    MAX_WORKERS = 5
     tasks = []
     for name, desc in AP_MODEL_STRUCTURE["objects"].items():
         tasks.append((product, "object", name, desc))
     for name, info in AP_MODEL_STRUCTURE["arrows"].items():
         tasks.append((product, "arrow", name, info))
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_task = {executor.submit(process_element, client, tavily_client, *task): task for task in tasks}
-        for future in concurrent.futures.as_completed(future_to_task):
-            task_name = future_to_task[future][2]
-            status_container.write(f"  - Searching element '{task_name}'...")
-            result, answer_text = future.result()
-            if result:
-                if result["type"] == "object": ap_model["nodes"].append(result["data"])
-                else: ap_model["arrows"].append(result["data"])
-            if answer_text: all_answers.append(answer_text)
+    future_to_task = {scheduler.submit(session_id, process_element, client, tavily_client, *task): task for task in tasks}
+    report_backlog(status_container, session_id)
+    for future in concurrent.futures.as_completed(future_to_task):
+        task_name = future_to_task[future][2]
+        status_container.write(f"  - Searching element '{task_name}'...")
+        result, answer_text = future.result()
+        if result:
+            if result["type"] == "object": ap_model["nodes"].append(result["data"])
+            else: ap_model["arrows"].append(result["data"])
+        if answer_text: all_answers.append(answer_text)
     
     status_container.write("Generating introduction...")
     intro_prompt = f"Based on the following information about {product} from various perspectives, create a concise introduction within 50 words in English about what {product} is.\n### Collected Information:\n{''.join(all_answers)}"
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": intro_prompt}], temperature=0)
+    response = chat_completion(client, "stage1_intro", model="gpt-4o", messages=[{"role": "user", "content": intro_prompt}], temperature=0)
     introduction = response.choices[0].message.content
-    return introduction, ap_model
+    model = APModel.from_dict(ap_model)
+    # The knowledge base refuses incomplete models
+    if knowledge_base:
+        knowledge_base.put(product, introduction, model)
+    return introduction, model
+
+class SilentStatus:
+    """Stand-in for st.status when Stage 1 is built outside a script run"""
+    def write(self, *args, **kwargs): pass
+    def update(self, **kwargs): pass
+
+@st.cache_resource
+def get_knowledge_base() -> Stage1KnowledgeBase:
+    """Process-wide knowledge base; stale entries are rebuilt in the background with the server's own keys"""
+    knowledge_base = Stage1KnowledgeBase()
+    if REFRESH_ENABLED:
+        client, tavily_client, error = initialize_clients()
+        if not error:
+            BackgroundRefresher(knowledge_base, lambda topic: build_stage1_ap_with_tavily(client, tavily_client, topic, SilentStatus(), "knowledge-base-refresh")).start()
+    return knowledge_base
+
+# ========== S-curve Stage Timeline ==========
+def stage_period(stage: int, num_stages: int) -> tuple:
+    """Map a stage number onto the S-curve period name and what that stage predicts"""
+    if stage == 1: return "Ferment Period", "Current Analysis"
+    if stage == num_stages: return "Maturity Period", "Maturity Prediction"
+    return "Take-off Period", "Development Prediction"
+
+def stage_label(stage: int, num_stages: int) -> str:
+    """Stage header for prompts, e.g. "Stage 3 of 5 (Take-off Period)"; the system prompt defines periods, not stage numbers"""
+    return f"Stage {stage} of {num_stages} ({stage_period(stage, num_stages)[0]})"
+
+def build_stage_context(stage: int, num_stages: int, timeline_summary: str) -> str:
+    return f"##Target stage: {stage_label(stage, num_stages)}\n##Timeline so far:\n{timeline_summary}"
+
+def summarize_timeline(client, topic: str, stage: int, num_stages: int, previous_summary: str, introduction: str, core_elements: dict) -> str:
+    """Fold a finished stage into the rolling timeline summary so later prompts stay a constant size"""
+    elements_text = "".join(f"{name}: {content}\n" for name, content in core_elements.items())
+    prompt = f"""
+Update the running summary of the technology timeline of {topic}.
+##Summary of the stages so far:
+{previous_summary or "(none yet)"}
+##{stage_label(stage, num_stages)}:
+{introduction}
+{elements_text}Write a single updated summary covering every stage so far within 120 words in English. Keep the key turning points of each stage and compress older stages more than recent ones.
+"""
+    response = chat_completion(client, "timeline_summary", model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0)
+    return response.choices[0].message.content.strip()
 
-# ========== Stage 2 & 3: Multi-Agent Functions ==========
+# ========== Stage 2+: Multi-Agent Functions ==========
 def generate_agents(client, topic: str) -> list:
     prompt = f"""
 Generate 3 completely different expert agents for generating AP model elements about the theme "{topic}".
@@ -215,11 +229,11 @@ Each agent must have different perspectives and expertise, and be able to provid
 Output in the following JSON format:
 {{ "agents": [ {{ "name": "Agent name", "expertise": "Field of expertise", "personality": "Personality/characteristics", "perspective": "Unique perspective" }} ] }}
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
+    response = chat_completion(client, "agents", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
     result = parse_json_response(response.choices[0].message.content)
     return result["agents"]
 
-def agent_generate_element(client, agent: dict, topic: str, element_type: str, previous_stage_ap: dict, user_vision: str, context: dict, previous_proposals: list) -> str:
+def agent_generate_element(client, agent: dict, topic: str, element_type: str, previous_stage_ap: APModel, user_vision: str, context: dict, previous_proposals: list, stage_context: str) -> str:
     context_info = ""
     if element_type == "Daily Spaces and User Experience": 
         context_info = f"##New Technology and Resources:\n{context.get('Technology and Resources', '')}"
@@ -231,8 +245,9 @@ def agent_generate_element(client, agent: dict, topic: str, element_type: str, p
     prompt = f"""
 As {agent['name']}, with expertise in {agent['expertise']} and characteristics of {agent['personality']}, analyze from the unique perspective of {agent['perspective']}.
 ##Theme: {topic}
+{stage_context}
 ##Previous stage AP model:
-{json.dumps(previous_stage_ap, ensure_ascii=False, indent=2)}
+{previous_stage_ap.to_json()}
 ##User's future vision:
 {user_vision}
 {context_info}
@@ -240,83 +255,141 @@ As {agent['name']}, with expertise in {agent['expertise']} and characteristics o
 **Important**: Avoid duplicating past proposals and provide new approaches from different angles. Avoid same or similar proposals and present completely new approaches utilizing your expertise.
 From your expertise and perspective, creatively and innovatively generate content for "{element_type}" in the next stage. Based on S-curve theory, consider development from the previous stage and new possibilities, and provide your unique, outstanding, and imaginative ideas **in text content only, within 30 words. No JSON format or extra explanations needed.**
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2)
+    response = chat_completion(client, "agent_proposal", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2)
     return response.choices[0].message.content.strip()
 
-def judge_element_proposals(client, proposals: list[dict], element_type: str, topic: str) -> dict:
-    proposals_text = "".join([f"##Proposal {i+1} (Agent: {p['agent_name']}):\n{p['proposal']}\n\n" for i, p in enumerate(proposals)])
+def judge_element_proposals(client, proposals: list[Proposal], element_type: str, topic: str) -> Judgment:
+    proposals_text = "".join([f"##Proposal {i+1} (Agent: {p.agent_name}):\n{p.proposal}\n\n" for i, p in enumerate(proposals)])
     prompt = f"""
 The following are {len(proposals)} proposals for "{element_type}" regarding "{topic}". Evaluate each proposal from the perspectives of creativity and future vision, and select the most imaginative proposal.
 {proposals_text}
 Output in the following JSON format:
 {{ "selected_proposal": "Agent name of selected proposal", "selected_content": "Content of selected {element_type} proposal", "selection_reason": "Selection reason (within 150 words)", "creativity_score": "Creativity evaluation (1-10)", "future_vision_score": "Future vision evaluation (1-10)" }}
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
-    return parse_json_response(response.choices[0].message.content)
+    response = chat_completion(client, "judge", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
+    return Judgment.from_dict(parse_json_response(response.choices[0].message.content))
 
-def final_judge_best_iteration_element(client, iteration_results: list, element_type: str, topic: str) -> dict:
+def final_judge_best_iteration_element(client, iteration_results: list[IterationRecord], element_type: str, topic: str) -> FinalDecision:
+    iterations_text = "".join([f"##Iteration {it.iteration_number} result:\n{compact_json(it.to_dict())}\n" for it in iteration_results])
     prompt = f"""
-The following are the results of 3 iterations for generating "{element_type}" of "{topic}". Comprehensively evaluate the improvement effects of each iteration and make the final selection of the best proposal.
-##Iteration 1 result:
-{json.dumps(iteration_results[0], ensure_ascii=False, indent=2)}
-##Iteration 2 result:
-{json.dumps(iteration_results[1], ensure_ascii=False, indent=2)}
-##Iteration 3 result:
-{json.dumps(iteration_results[2], ensure_ascii=False, indent=2)}
-Output in the following JSON format:
-{{ "final_selected_iteration": "Selected iteration number (1, 2, or 3)", "final_selection_reason": "Final selection reason (within 30 words)", "final_selected_content": "Final selected content of {element_type}" }}
+The following are the results of {len(iteration_results)} iterations for generating "{element_type}" of "{topic}". Comprehensively evaluate the improvement effects of each iteration and make the final selection of the best proposal.
+{iterations_text}Output in the following JSON format:
+{{ "final_selected_iteration": "Selected iteration number (1-{NUM_ITERATIONS})", "final_selection_reason": "Final selection reason (within 30 words)", "final_selected_content": "Final selected content of {element_type}" }}
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
-    return parse_json_response(response.choices[0].message.content)
+    response = chat_completion(client, "final_judge", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=1.2, response_format={"type": "json_object"})
+    return FinalDecision.from_dict(parse_json_response(response.choices[0].message.content))
 
-def generate_single_element_with_iterations(client, status_container, topic: str, element_type: str, previous_stage_ap: dict, agents: list, user_vision: str, context: dict) -> dict:
+def generate_single_element_with_iterations(client, status_container, topic: str, element_type: str, previous_stage_ap: APModel, agents: list, user_vision: str, context: dict, stage_context: str, session_id: str) -> ElementResult:
     iteration_results = []
     agent_history = {agent['name']: [] for agent in agents}
-    for iteration in range(1, 4):
-        status_container.write(f"    - Iteration {iteration}/3: {len(agents)} agents generating proposals...")
+    for iteration in range(1, NUM_ITERATIONS + 1):
+        status_container.write(f"    - Iteration {iteration}/{NUM_ITERATIONS}: {len(agents)} agents generating proposals...")
         proposals = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(agents)) as executor:
-            future_to_agent = {executor.submit(agent_generate_element, client, agent, topic, element_type, previous_stage_ap, user_vision, context, agent_history[agent['name']]): agent for agent in agents}
-            for future in concurrent.futures.as_completed(future_to_agent):
-                agent = future_to_agent[future]
-                try:
-                    proposal_content = future.result()
-                    proposals.append({"agent_name": agent['name'], "proposal": proposal_content})
-                    agent_history[agent['name']].append(proposal_content)
-                except Exception as exc: st.warning(f"Error in proposal generation by {agent['name']}: {exc}")
+        future_to_agent = {scheduler.submit(session_id, agent_generate_element, client, agent, topic, element_type, previous_stage_ap, user_vision, context, agent_history[agent['name']], stage_context): agent for agent in agents}
+        report_backlog(status_container, session_id)
+        for future in concurrent.futures.as_completed(future_to_agent):
+            agent = future_to_agent[future]
+            try:
+                proposal_content = future.result()
+                proposals.append(Proposal(agent['name'], proposal_content))
+                agent_history[agent['name']].append(proposal_content)
+            except Exception as exc: st.warning(f"Error in proposal generation by {agent['name']}: {exc}")
         if not proposals: continue
-        status_container.write(f"    - Iteration {iteration}/3: Evaluation by judge...")
+        status_container.write(f"    - Iteration {iteration}/{NUM_ITERATIONS}: Evaluation by judge...")
         judgment = judge_element_proposals(client, proposals, element_type, topic)
-        iteration_results.append({"iteration_number": iteration, "all_agent_proposals": proposals, "judgment": judgment})
-    if not iteration_results: return {"element_type": element_type, "error": "No proposals were generated."}
+        iteration_results.append(IterationRecord(iteration, proposals, judgment))
+    if not iteration_results: return ElementResult(element_type, error="No proposals were generated.")
     status_container.write(f"  - Final judgment for '{element_type}'...")
     final_judgment = final_judge_best_iteration_element(client, iteration_results, element_type, topic)
-    return {"element_type": element_type, "iterations": iteration_results, "final_decision": final_judgment}
+    return ElementResult(element_type, final_judgment, iteration_results, len(iteration_results))
 
-def build_complete_ap_model(client, topic: str, previous_ap: dict, new_elements: dict, stage: int, user_vision: str) -> dict:
+# ========== Incremental AP Model Evolution ==========
+def regenerate_ap_node(client, topic: str, stage: int, num_stages: int, object_name: str, new_content: str, previous_node: APNode) -> APNode:
     prompt = f"""
-Build the complete AP model for Stage {stage}.
-##Previous stage information:
-{json.dumps(previous_ap, ensure_ascii=False, indent=2)}
-##Newly generated core elements:
-Technology and Resources: {new_elements["Technology and Resources"]}
-Daily Spaces and User Experience: {new_elements["Daily Spaces and User Experience"]}
-Avant-garde Social Issues: {new_elements["Avant-garde Social Issues"]}
+Update the AP model object "{object_name}" of {topic} for {stage_label(stage, num_stages)}.
+##Previous stage version:
+{json.dumps(previous_node.to_dict() if previous_node else {}, ensure_ascii=False)}
+##New content for Stage {stage}:
+{new_content}
+Output in the following JSON format:
+{{"type": "{object_name}", "definition": "Description of this object in Stage {stage}", "example": "Specific example of this object"}}
+"""
+    response = chat_completion(client, "node_update", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], response_format={"type": "json_object"})
+    return APNode.from_dict(parse_json_response(response.choices[0].message.content))
+
+def regenerate_ap_arrow(client, topic: str, stage: int, num_stages: int, arrow_name: str, previous_arrow: APArrow, endpoints: dict) -> APArrow:
+    arrow_info = AP_MODEL_STRUCTURE["arrows"][arrow_name]
+    prompt = f"""
+Update the AP model arrow "{arrow_name}" ({arrow_info['from']} → {arrow_info['to']}: {arrow_info['description']}) of {topic} for {stage_label(stage, num_stages)}.
+##Previous stage version:
+{json.dumps(previous_arrow.to_dict() if previous_arrow else {}, ensure_ascii=False)}
+##Stage {stage} source ({arrow_info['from']}):
+{endpoints[arrow_info['from']]}
+##Stage {stage} target ({arrow_info['to']}):
+{endpoints[arrow_info['to']]}
+Output in the following JSON format:
+{{"source": "{arrow_info['from']}", "target": "{arrow_info['to']}", "type": "{arrow_name}", "definition": "Description of this arrow in Stage {stage}", "example": "Specific example of this arrow"}}
+"""
+    response = chat_completion(client, "arrow_update", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], response_format={"type": "json_object"})
+    return APArrow.from_dict(parse_json_response(response.choices[0].message.content))
+
+def refresh_unaffected_elements(client, topic: str, stage: int, num_stages: int, previous_items: APModel, new_elements: dict, user_vision: str) -> APModel:
+    prompt = f"""
+The following AP model elements of {topic} are not directly changed in {stage_label(stage, num_stages)}. Lightly rewrite each of them so it stays consistent with the new core elements. Keep the content close to the previous version.
+##Elements to carry over:
+{previous_items.to_json()}
+##New core elements of Stage {stage}:
+{json.dumps(new_elements, ensure_ascii=False)}
 ##User's future vision:
 {user_vision}
-**Important**: Stage {stage} must include all of the following 6 objects and 12 arrows:
-Objects: Avant-garde Social Issues, People's Values, Social Issues, Technology and Resources, Daily Spaces and User Experience, Institutions
-Arrows: Media, Community Formation, Cultural Arts Promotion, Standardization, Communication, Organization, Meaning Attribution, Products/Services, Habituation, Paradigm, Business Ecosystem, Art (Social Criticism)
-Center on the newly generated 3 elements, update other elements with content appropriate for Stage {stage}, and build all arrow relationships.
-Output in the following JSON format:
+Output in the following JSON format with the same items:
 {{"nodes": [{{"type": "Object name", "definition": "Description of this object", "example": "Specific example of this object"}}], "arrows": [{{"source": "Source object", "target": "Target object", "type": "Arrow name", "definition": "Description of this arrow", "example": "Specific example of this arrow"}}]}}
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], response_format={"type": "json_object"})
-    return parse_json_response(response.choices[0].message.content)
+    response = chat_completion(client, "carry_over_update", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], response_format={"type": "json_object"})
+    return APModel.from_dict(parse_json_response(response.choices[0].message.content))
+
+def merge_ap_model(previous_ap: APModel, updated_nodes: dict, updated_arrows: dict) -> APModel:
+    """Merge updated items over the previous model and return a complete 6-object/12-arrow model"""
+    model = APModel()
+    for name, description in AP_MODEL_STRUCTURE["objects"].items():
+        node = updated_nodes.get(name) if updated_nodes.get(name) and updated_nodes[name].definition else previous_ap.node(name)
+        model.nodes[name] = APNode(name, node.definition if node else description, node.example if node else "")
+    for name, info in AP_MODEL_STRUCTURE["arrows"].items():
+        arrow = updated_arrows.get(name) if updated_arrows.get(name) and updated_arrows[name].definition else previous_ap.arrow(name)
+        model.arrows[name] = APArrow(name, info["from"], info["to"], arrow.definition if arrow else info["description"], arrow.example if arrow else "")
+    return model
+
+def build_incremental_ap_model(client, topic: str, previous_ap: APModel, new_elements: dict, stage: int, num_stages: int, user_vision: str, session_id: str) -> APModel:
+    """Evolve the previous AP model by regenerating only the items touched by the new core elements"""
+    affected_arrows = find_affected_arrows(new_elements)
+    endpoints = {name: new_elements.get(name) or (previous_ap.node(name).definition if previous_ap.node(name) else desc) for name, desc in AP_MODEL_STRUCTURE["objects"].items()}
+    carried_over = APModel(
+        {name: node for name, node in previous_ap.nodes.items() if name not in new_elements},
+        {name: arrow for name, arrow in previous_ap.arrows.items() if name not in affected_arrows},
+    )
+    updated_nodes, updated_arrows = {}, {}
+    future_to_item = {scheduler.submit(session_id, regenerate_ap_node, client, topic, stage, num_stages, name, content, previous_ap.node(name)): ("node", name) for name, content in new_elements.items()}
+    future_to_item.update({scheduler.submit(session_id, regenerate_ap_arrow, client, topic, stage, num_stages, name, previous_ap.arrow(name), endpoints): ("arrow", name) for name in affected_arrows})
+    if carried_over.nodes or carried_over.arrows:
+        future_to_item[scheduler.submit(session_id, refresh_unaffected_elements, client, topic, stage, num_stages, carried_over, new_elements, user_vision)] = ("carry-over", None)
+    for future in concurrent.futures.as_completed(future_to_item):
+        kind, name = future_to_item[future]
+        try:
+            result = future.result()
+        except Exception as exc:
+            st.warning(f"Error while updating '{name or 'unchanged elements'}', keeping previous stage content: {exc}")
+            continue
+        if kind == "node": updated_nodes[name] = result
+        elif kind == "arrow": updated_arrows[name] = result
+        else:
+            # Only accept rewrites of items that were actually carried over
+            updated_nodes.update({k: v for k, v in result.nodes.items() if k in carried_over.nodes})
+            updated_arrows.update({k: v for k, v in result.arrows.items() if k in carried_over.arrows})
+    return merge_ap_model(previous_ap, updated_nodes, updated_arrows)
 
-def generate_stage_introduction(client, topic: str, stage: int, new_elements: dict, user_vision: str) -> str:
+def generate_stage_introduction(client, topic: str, stage: int, num_stages: int, new_elements: dict, user_vision: str) -> str:
     prompt = f"""
-Create an introduction for Stage {stage} of {topic} based on the following newly generated elements.
+Create an introduction for {stage_label(stage, num_stages)} of {topic} based on the following newly generated elements.
 ##Generated elements:
 Technology and Resources: {new_elements["Technology and Resources"]}
 Daily Spaces and User Experience: {new_elements["Daily Spaces and User Experience"]}
@@ -325,24 +398,27 @@ Avant-garde Social Issues: {new_elements["Avant-garde Social Issues"]}
 {user_vision}
 Create a concise introduction within 30 words in English about what the situation of {topic} in Stage {stage} would be like.
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=0)
+    response = chat_completion(client, "stage_intro", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], temperature=0)
     return response.choices[0].message.content.strip()
 
 # ========== Story Generation Functions ==========
-def generate_outline(client, theme: str, scene: str, ap_model_history: list) -> str:
+def generate_outline(client, theme: str, scene: str, ap_model_history: list[StageRecord], background_summary: str) -> str:
+    """Only the last two stages are inlined in full; earlier stages arrive as the rolling summary"""
+    beginning, ending = ap_model_history[-2], ap_model_history[-1]
+    num_stages = len(ap_model_history)
     prompt = f"""
 You are a professional SF writer. Based on the following information, create a synopsis for a short SF novel with the theme "{theme}".
 ## Story Setting:
 {scene}
-## Story Beginning (S-curve Stage 2):
-{json.dumps(ap_model_history[1]['ap_model'], ensure_ascii=False, indent=2)}
-## Story Ending (S-curve Stage 3):
-{json.dumps(ap_model_history[2]['ap_model'], ensure_ascii=False, indent=2)}
-## Story Background (S-curve Stage 1):
-{json.dumps(ap_model_history[0]['ap_model'], ensure_ascii=False, indent=2)}
+## Story Beginning (S-curve {stage_label(beginning.stage, num_stages)}):
+{beginning.ap_model.to_json()}
+## Story Ending (S-curve {stage_label(ending.stage, num_stages)}):
+{ending.ap_model.to_json()}
+## Story Background (S-curve Stages 1-{beginning.stage - 1}):
+{background_summary}
 Based on the above information, create a story synopsis that includes the main plot, characters, and central conflicts unfolding in the specified setting. The synopsis should be innovative and compelling, following the style of SF novels.
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}])
+    response = chat_completion(client, "outline", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}])
     return response.choices[0].message.content
 
 def generate_story(client, theme: str, outline: str) -> str:
@@ -352,81 +428,121 @@ You are a professional SF writer. Based on the following synopsis, write a short
 {outline}
 Write a coherent story following this synopsis. The story should be innovative, compelling, and follow the SF style. Please write approximately 500 words in English.
 """
-    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}])
+    response = chat_completion(client, "story", model="gpt-4o", messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}])
     return response.choices[0].message.content
 
+# ========== Best-of-K Story Selection ==========
+MAX_STORY_CANDIDATES = 5
+
+@st.cache_resource
+def get_scoring_pool():
+    """One background process per server for local story metrics, kept off the script thread"""
+    import multiprocessing
+    from benchmark_eval import download_nltk_data
+    # Fetched once per server here, so the scoring process never downloads while a user waits
+    download_nltk_data()
+    return concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+def generate_story_candidate(client, theme: str, scene: str, ap_model_history: list[StageRecord], background_summary: str) -> dict:
+    outline = generate_outline(client, theme, scene, ap_model_history, background_summary)
+    return {"outline": outline, "story": generate_story(client, theme, outline)}
+
+def judge_story_candidates(client, theme: str, stories: list) -> dict:
+    stories_text = "".join([f"##Story {i+1}:\n{story}\n\n" for i, story in enumerate(stories)])
+    prompt = f"""
+The following are {len(stories)} short SF stories with the theme "{theme}". Evaluate each story from the perspectives of fluency, creativity, attractiveness and plausibility, and select the best one.
+{stories_text}
+Output in the following JSON format:
+{{ "best_candidate": "Number of the best story (1-{len(stories)})", "selection_reason": "Selection reason (within 50 words)" }}
+"""
+    response = chat_completion(client, "story_judge", model="gpt-4o", messages=[{"role": "user", "content": prompt}], temperature=0, response_format={"type": "json_object"})
+    return parse_json_response(response.choices[0].message.content)
+
+def generate_best_story(client, theme: str, scene: str, ap_model_history: list[StageRecord], background_summary: str, num_candidates: int, use_llm_judge: bool, status_container, session_id: str) -> dict:
+    """Generate candidates concurrently and keep the best by local metrics or one batched LLM judge"""
+    from benchmark_eval import score_story
+    candidates, score_futures = {}, {}
+    scoring_pool = None
+    if num_candidates > 1 and not use_llm_judge:
+        try: scoring_pool = get_scoring_pool()
+        except LookupError as exc: st.warning(f"Local story scoring is unavailable: {exc}")
+    future_to_index = {scheduler.submit(session_id, generate_story_candidate, client, theme, scene, ap_model_history, background_summary): i for i in range(1, num_candidates + 1)}
+    report_backlog(status_container, session_id)
+    for done, future in enumerate(concurrent.futures.as_completed(future_to_index), 1):
+        index = future_to_index[future]
+        try: candidates[index] = future.result()
+        except Exception as exc:
+            st.warning(f"Error in story candidate {index}: {exc}")
+            continue
+        status_container.write(f"  - Candidate {index} ready ({done}/{num_candidates})")
+        # Score while the remaining candidates are still being written
+        if scoring_pool: score_futures[index] = scoring_pool.submit(score_story, candidates[index]["story"])
+    if not candidates: raise RuntimeError("No story candidates were generated.")
+
+    selection = {"method": "single", "selected": min(candidates), "scores": {}, "reason": ""}
+    if len(candidates) > 1 and use_llm_judge:
+        status_container.write("  - Judging candidates...")
+        indices = sorted(candidates)
+        judgment = judge_story_candidates(client, theme, [candidates[i]["story"] for i in indices])
+        try: selection.update(method="llm_judge", selected=indices[int(judgment["best_candidate"]) - 1], reason=judgment.get("selection_reason", ""))
+        except (KeyError, ValueError, IndexError): st.warning(f"Unexpected judge output, keeping candidate {selection['selected']}: {judgment}")
+    elif len(candidates) > 1:
+        status_container.write("  - Scoring candidates with local metrics...")
+        for index, future in score_futures.items():
+            try: selection["scores"][index] = future.result()
+            except Exception as exc: st.warning(f"Local scoring failed for candidate {index}: {exc}")
+        if selection["scores"]:
+            selection.update(method="local_metrics", selected=max(selection["scores"], key=lambda i: selection["scores"][i]["score"]))
+        else:
+            selection["reason"] = "Local scoring failed for every candidate, so they could not be compared."
+    selection["num_candidates"] = len(candidates)
+    return {**candidates[selection["selected"]], "selection": selection}
+
 # ========== UI Functions for Visualization ==========
-def show_visualization(ap_history, height=750):
-    """Generate and display visualization HTML based on AP model history"""
+# Stages drawn per diagram: the latest stage plus the one it evolved from
+VISUALIZATION_WINDOW = 2
+
+def show_visualization(ap_history, window=VISUALIZATION_WINDOW):
+    """Display the last `window` stages of the AP model history as a server-rendered SVG (None shows all)"""
     if not ap_history:
         st.warning("No data to visualize.")
         return
-    
-    html_content = f'''
-    <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>AP Model Visualization</title><style>
-    body{{font-family:sans-serif;background-color:#f0f2f6;margin:0;padding:20px;}}
-    .vis-wrapper{{overflow-x:auto;border:1px solid #ddd;border-radius:10px;background:white;padding-top:20px;}}
-    .visualization{{position:relative;width:{len(ap_history)*720}px;height:680px;background:#fafafa;}}
-    .node{{position:absolute;width:140px;height:140px;border-radius:50%;display:flex;align-items:center;justify-content:center;font-size:13px;font-weight:bold;text-align:center;cursor:pointer;transition:all .3s;box-shadow:0 4px 12px rgba(0,0,0,.15);border:3px solid white;line-height:1.2;padding:15px;box-sizing:border-box;}}
-    .node:hover{{transform:scale(1.1);z-index:100;}}.node-avant-garde{{background:#ff9999;}}.node-values{{background:#ecba13;}}.node-social{{background:#ffff99;}}.node-technology{{background:#99cc99;}}.node-daily{{background:#99cccc;}}.node-institutions{{background:#9999ff;}}
-    .arrow{{position:absolute;height:2px;background:#333;transform-origin:left center;z-index:1;}}
-    .arrow::after{{content:'';position:absolute;right:-8px;top:-4px;width:0;height:0;border-left:8px solid #333;border-top:4px solid transparent;border-bottom:4px solid transparent;}}
-    .arrow-label{{position:absolute;background:white;padding:2px 8px;border:1px solid #ddd;border-radius:15px;font-size:10px;white-space:nowrap;transform:translate(-50%,-50%);z-index:10;}}
-    .dotted-arrow{{border-top:2px dotted #333;background:transparent;}}.dotted-arrow::after{{border-left-color:#333;}}
-    .tooltip{{position:absolute;background:rgba(0,0,0,.9);color:white;padding:12px;border-radius:8px;font-size:12px;max-width:300px;z-index:1000;pointer-events:none;opacity:0;transition:opacity .3s;line-height:1.4;}}
-    .tooltip.show{{opacity:1;}}
-    </style></head><body><div class="vis-wrapper"><div class="visualization" id="visualization"></div></div><div class="tooltip" id="tooltip"></div><script>
-    const viz=document.getElementById('visualization'),tooltip=document.getElementById('tooltip');let allNodes={{}};const apData={json.dumps(ap_history,ensure_ascii=False)};
-    function getNodeClass(type){{
-        const mapping = {{
-            'Avant-garde Social Issues': 'avant-garde',
-            'People\\'s Values': 'values', 
-            'Social Issues': 'social',
-            'Technology and Resources': 'technology',
-            'Daily Spaces and User Experience': 'daily',
-            'Institutions': 'institutions'
-        }};
-        return mapping[type] || 'default';
-    }}
-    function getPos(s,t){{const w=700,o=s*w;if(s%2===0){{switch(t){{case'Institutions':return{{x:o+355,y:50}};case'Daily Spaces and User Experience':return{{x:o+180,y:270}};case'Social Issues':return{{x:o+530,y:270}};case'Technology and Resources':return{{x:o+50,y:500}};case'Avant-garde Social Issues':return{{x:o+355,y:500}};case'People\\'s Values':return{{x:o+660,y:500}};default:return null}}}}else{{switch(t){{case'Technology and Resources':return{{x:o+50,y:50}};case'Avant-garde Social Issues':return{{x:o+355,y:50}};case'People\\'s Values':return{{x:o+660,y:50}};case'Daily Spaces and User Experience':return{{x:o+180,y:270}};case'Social Issues':return{{x:o+530,y:270}};case'Institutions':return{{x:o+355,y:500}};default:return null}}}}}}
-    function render(){{viz.innerHTML='';allNodes={{}};apData.forEach((s,i)=>{{if(!s.ap_model||!s.ap_model.nodes)return;s.ap_model.nodes.forEach(d=>{{const p=getPos(i,d.type);if(!p)return;const n=document.createElement('div');n.className=`node node-${{getNodeClass(d.type)}}`;n.style.left=p.x+'px';n.style.top=p.y+'px';n.textContent=d.type;const e=d.definition+(d.example?`\\n\\n[Example] `+d.example:"");n.dataset.definition=e.replace(/\\n/g,'<br>');n.dataset.id=`s${{s.stage}}-${{d.type}}`;n.addEventListener('mouseenter',showTip);n.addEventListener('mouseleave',hideTip);viz.appendChild(n);allNodes[n.dataset.id]=n}})}});apData.forEach((s,i)=>{{if(!s.ap_model||!s.ap_model.arrows)return;const next=apData[i+1];s.ap_model.arrows.forEach(a=>{{const isLast=!next,type=a.type,hide=isLast&&['Standardization','Organization','Meaning Attribution','Habituation'].includes(type);if(hide)return;let src=allNodes[`s${{s.stage}}-${{a.source}}`],tgt,isInter=false;if(next&&(type==='Organization'||type==='Standardization')){{tgt=allNodes[`s${{next.stage}}-Technology and Resources`];isInter=!!tgt}}else if(next&&type==='Meaning Attribution'){{tgt=allNodes[`s${{next.stage}}-Daily Spaces and User Experience`];isInter=!!tgt}}else if(next&&type==='Habituation'){{tgt=allNodes[`s${{next.stage}}-Institutions`];isInter=!!tgt}}if(!isInter){{tgt=allNodes[`s${{s.stage}}-${{a.target}}`];}}if(src&&tgt){{const d=type==='Art (Social Criticism)'||type==='Media';createArrow(src,tgt,a,d)}}}})}})}}
-    function createArrow(s,t,a,d){{const r=70,p1={{x:parseFloat(s.style.left),y:parseFloat(s.style.top)}},p2={{x:parseFloat(t.style.left),y:parseFloat(t.style.top)}},dx=p2.x+r-(p1.x+r),dy=p2.y+r-(p1.y+r),dist=Math.sqrt(dx*dx+dy*dy),ang=Math.atan2(dy,dx)*180/Math.PI,sx=p1.x+r+dx/dist*r,sy=p1.y+r+dy/dist*r,adjDist=dist-r*2,ar=document.createElement('div');ar.className=d?'arrow dotted-arrow':'arrow';ar.style.left=sx+'px';ar.style.top=sy+'px';ar.style.width=adjDist+'px';ar.style.transform=`rotate(${{ang}}deg)`;const l=document.createElement('div');l.className='arrow-label';l.textContent=a.type;const lx=sx+dx/dist*adjDist/2,ly=sy+dy/dist*adjDist/2;l.style.left=lx+'px';l.style.top=ly+'px';const e=a.definition+(a.example?`\\n\\n[Example] `+a.example:"");l.dataset.definition=e.replace(/\\n/g,'<br>');l.addEventListener('mouseenter',showTip);l.addEventListener('mouseleave',hideTip);viz.appendChild(ar);viz.appendChild(l)}}
-    function showTip(e){{const d=e.target.dataset.definition;if(d){{tooltip.innerHTML=d;tooltip.style.left=e.pageX+15+'px';tooltip.style.top=e.pageY-10+'px';tooltip.classList.add('show')}}}}
-    function hideTip(){{tooltip.classList.remove('show')}}
-    render();
-    </script></body></html>'''
-    st.components.v1.html(html_content, height=height, scrolling=True)
-
-def show_agent_proposals(element_result):
+    st.html(render_ap_timeline_html(ap_history[-window:] if window else ap_history))
+
+def show_agent_proposals(element_result: ElementResult, transcript_store: TranscriptStore):
     """Display multi-agent proposal results nicely"""
-    st.markdown(f"#### 🧠 Generation Process for '{element_result['element_type']}'")
+    st.markdown(f"#### 🧠 Generation Process for '{element_result.element_type}'")
+    if element_result.error:
+        st.warning(element_result.error)
+        return
     
-    for iteration in element_result['iterations']:
+    for iteration in transcript_store.load(element_result):
         st.markdown(f"---")
-        st.markdown(f"##### Iteration {iteration['iteration_number']}/3")
+        st.markdown(f"##### Iteration {iteration.iteration_number}/{NUM_ITERATIONS}")
         
         st.markdown("###### 🤖 Proposals from Each Agent")
-        cols = st.columns(len(iteration['all_agent_proposals']))
-        for i, proposal in enumerate(iteration['all_agent_proposals']):
+        cols = st.columns(len(iteration.proposals))
+        for i, proposal in enumerate(iteration.proposals):
             with cols[i]:
-                st.markdown(f"**{proposal['agent_name']}**")
-                st.info(proposal['proposal'])
+                st.markdown(f"**{proposal.agent_name}**")
+                st.info(proposal.proposal)
         
         st.markdown("###### 🎯 Judgment Result")
-        judgment = iteration['judgment']
-        st.success(f"**Selected Proposal:** {judgment['selected_proposal']}")
-        st.write(f"**Selected Content:** {judgment['selected_content']}")
-        st.write(f"**Selection Reason:** {judgment['selection_reason']}")
+        judgment = iteration.judgment
+        st.success(f"**Selected Proposal:** {judgment.selected_proposal}")
+        st.write(f"**Selected Content:** {judgment.selected_content}")
+        st.write(f"**Selection Reason:** {judgment.selection_reason}")
     
     st.markdown("---")
     st.markdown("##### 🏆 Final Decision")
-    final_decision = element_result['final_decision']
-    st.success(f"**Finally Selected Content (from Iteration {final_decision['final_selected_iteration']}):**")
-    st.info(f"{final_decision['final_selected_content']}")
+    final_decision = element_result.final_decision
+    st.success(f"**Finally Selected Content (from Iteration {final_decision.final_selected_iteration}):**")
+    st.info(f"{final_decision.final_selected_content}")
 
 # ========== API Key Validation Function ==========
 def validate_openai_key(api_key: str) -> bool:
     """Validate OpenAI API key by making a simple test call"""
+    from openai import OpenAI
     try:
         test_client = OpenAI(api_key=api_key)
         # Make a minimal test call
@@ -446,18 +562,48 @@ if 'process_started' not in st.session_state:
     st.session_state.process_started = False
     st.session_state.topic = ""
     st.session_state.scene = ""
+    st.session_state.num_stages = DEFAULT_NUM_STAGES
     st.session_state.user_api_key = ""
     st.session_state.ap_history = []
     st.session_state.descriptions = []
+    st.session_state.timeline_summaries = []
     st.session_state.story = ""
+    st.session_state.story_candidates = 1
+    st.session_state.story_judge = False
+    st.session_state.story_selection = {}
     st.session_state.agents = []
-    st.session_state.stage_elements_results = {'stage2': [], 'stage3': []}
+    st.session_state.stage_elements_results = {}
     st.session_state.client = None
     st.session_state.tavily_client = None
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Full iteration transcripts live on disk; session state keeps only the final decisions
+transcript_store = TranscriptStore(st.session_state.session_id)
+
+# --- Run Monitoring ---
+def pipeline_step() -> str:
+    """Name of the state-machine step this script run works on"""
+    if not st.session_state.process_started: return "input"
+    if st.session_state.story: return "done"
+    if not st.session_state.ap_history: return "stage1"
+    stage = len(st.session_state.ap_history) + 1
+    if stage > st.session_state.num_stages: return "story"
+    if not st.session_state.agents: return "agents"
+    stage_results = st.session_state.stage_elements_results.get(f'stage{stage}', [])
+    if len(stage_results) < len(CORE_ELEMENTS): return f"stage{stage}: {CORE_ELEMENTS[len(stage_results)]}"
+    return f"stage{stage}: build"
+
+run_session_id, run_step = st.session_state.session_id, pipeline_step()
+monitor.heartbeat(run_session_id, run_step, st.session_state.topic)
+
+def rerun():
+    """st.rerun() that first records how long this script run took"""
+    monitor.finish_run(run_session_id, run_step, time.perf_counter() - run_started)
+    st.rerun()
 
 # --- STEP 0: Initial Input Screen ---
 if not st.session_state.process_started:
-    st.markdown("Enter your **OpenAI API key**, the **theme** you want to explore and the **setting** for the story. AI will predict the future in 3 stages and automatically generate an SF novel to completion.")
+    st.markdown("Enter your **OpenAI API key**, the **theme** you want to explore and the **setting** for the story. AI will predict the future along the S-curve in the selected number of stages and automatically generate an SF novel to completion.")
     
     # API Key input
     st.markdown("### 🔑 API Configuration")
@@ -481,6 +627,36 @@ if not st.session_state.process_started:
     st.markdown("### 📝 Content Configuration")
     topic_input = st.text_input("Enter the theme you want to explore", placeholder="e.g., AI, autonomous driving, quantum computing")
     scene_input = st.text_area("Describe the story scenario in detail", placeholder="e.g., A futuristic city at sunset, a quantum research lab")
+    num_stages_input = st.number_input(
+        "Number of S-curve stages",
+        min_value=DEFAULT_NUM_STAGES,
+        max_value=MAX_NUM_STAGES,
+        value=DEFAULT_NUM_STAGES,
+        help="Stage 1 analyzes the present, the last stage is the maturity period and every stage in between is a take-off period."
+    )
+    story_candidates_input = st.number_input(
+        "Story candidates (best-of-K)",
+        min_value=1,
+        max_value=MAX_STORY_CANDIDATES,
+        value=1,
+        help="Generate several outlines and stories in parallel and keep the best one."
+    )
+    story_judge_input = st.checkbox(
+        "Select the best candidate with an LLM judge instead of local text metrics",
+        disabled=story_candidates_input < 2
+    )
+
+    stage1_cached = bool(topic_input) and get_knowledge_base().match(topic_input) is not None
+    run_estimate = estimate_run(int(num_stages_input), story_candidates=int(story_candidates_input), story_judge=story_judge_input, stage1_cached=stage1_cached)
+    with st.expander("📊 Estimated calls, cost & time for this run"):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("API calls", f"{run_estimate.llm_calls} + {run_estimate.searches} searches")
+        col2.metric("Tokens", f"{(run_estimate.prompt_tokens + run_estimate.completion_tokens) / 1000:.0f}k")
+        col3.metric("Cost", f"${run_estimate.cost_usd:.2f}")
+        col4.metric("Time", f"~{run_estimate.critical_path_seconds / 60:.0f} min")
+        calibrated = ", ".join(run_estimate.calibrated_call_types) or "none yet"
+        st.caption(f"Based on recorded telemetry for: {calibrated}. Other call types use default estimates."
+                   + (" Stage 1 will be loaded from the knowledge base." if stage1_cached else ""))
 
     # Check if all inputs are valid
     all_inputs_valid = api_key_input and key_valid and topic_input and scene_input
@@ -494,11 +670,15 @@ if not st.session_state.process_started:
         else:
             st.session_state.topic = topic_input
             st.session_state.scene = scene_input
+            st.session_state.num_stages = int(num_stages_input)
+            st.session_state.story_candidates = int(story_candidates_input)
+            st.session_state.story_judge = story_judge_input and story_candidates_input > 1
+            st.session_state.stage_elements_results = {f'stage{n}': [] for n in range(2, st.session_state.num_stages + 1)}
             st.session_state.user_api_key = api_key_input
             st.session_state.client = client
             st.session_state.tavily_client = tavily_client
             st.session_state.process_started = True
-            st.rerun()
+            rerun()
 
 # --- Fully Automated Execution Process ---
 else:
@@ -513,49 +693,42 @@ else:
     
     st.header(f"Theme: {st.session_state.topic}")
     user_vision = f"Imagine the future development of '{st.session_state.topic}' through technological evolution."
+    num_stages = st.session_state.num_stages
 
     # ==================================================================
     # Display Areas: Always show existing data
     # ==================================================================
-    # --- Stage 1 Display ---
-    if len(st.session_state.ap_history) >= 1:
-        st.markdown("---")
-        st.header("Stage 1: Ferment Period (Current Analysis)")
-        st.info(st.session_state.descriptions[0])
-        show_visualization(st.session_state.ap_history[0:1])
-
-    # --- Stage 2 Display ---
-    if st.session_state.agents:
-        st.markdown("---")
-        st.header("Stage 2: Take-off Period (Development Prediction)")
-        st.subheader("🤖 Expert AI Agent Team")
-        with st.expander("View Generated Agents", expanded=True):
-            cols = st.columns(len(st.session_state.agents))
-            for i, agent in enumerate(st.session_state.agents):
-                with cols[i]:
-                    st.markdown(f"**{agent['name']}**")
-                    st.write(f"**Expertise:** {agent['expertise']}")
-                    st.write(f"**Personality:** {agent['personality']}")
-                    st.write(f"**Perspective:** {agent['perspective']}")
-    
-    if st.session_state.stage_elements_results['stage2']:
-        for result in st.session_state.stage_elements_results['stage2']:
-            show_agent_proposals(result)
-
-    if len(st.session_state.ap_history) >= 2:
-        st.info(st.session_state.descriptions[1])
-        show_visualization(st.session_state.ap_history[0:2])
-
-    # --- Stage 3 Display ---
-    if st.session_state.stage_elements_results['stage3']:
-        st.markdown("---")
-        st.header("Stage 3: Maturity Period (Maturity Prediction)")
-        for result in st.session_state.stage_elements_results['stage3']:
-            show_agent_proposals(result)
-            
-    if len(st.session_state.ap_history) >= 3:
-        st.info(st.session_state.descriptions[2])
-        show_visualization(st.session_state.ap_history)
+    for stage in range(1, num_stages + 1):
+        period, focus = stage_period(stage, num_stages)
+        stage_results = st.session_state.stage_elements_results.get(f'stage{stage}', [])
+        if stage == 1:
+            if len(st.session_state.ap_history) < 1: continue
+            st.markdown("---")
+            st.header(f"Stage 1: {period} ({focus})")
+        elif stage == 2 and st.session_state.agents:
+            st.markdown("---")
+            st.header(f"Stage 2: {period} ({focus})")
+            st.subheader("🤖 Expert AI Agent Team")
+            with st.expander("View Generated Agents", expanded=True):
+                cols = st.columns(len(st.session_state.agents))
+                for i, agent in enumerate(st.session_state.agents):
+                    with cols[i]:
+                        st.markdown(f"**{agent['name']}**")
+                        st.write(f"**Expertise:** {agent['expertise']}")
+                        st.write(f"**Personality:** {agent['personality']}")
+                        st.write(f"**Perspective:** {agent['perspective']}")
+        elif stage > 2 and stage_results:
+            st.markdown("---")
+            st.header(f"Stage {stage}: {period} ({focus})")
+
+        for result in stage_results:
+            show_agent_proposals(result, transcript_store)
+
+        if len(st.session_state.ap_history) >= stage:
+            st.info(st.session_state.descriptions[stage - 1])
+            # Only the newest diagram is sent on every rerun; earlier ones are drawn on request
+            if stage == len(st.session_state.ap_history) or st.toggle(f"Show Stage {stage} AP model", key=f"show_ap_stage{stage}"):
+                show_visualization(st.session_state.ap_history[0:stage])
 
     # --- Story Display ---
     if st.session_state.story:
@@ -564,92 +737,113 @@ else:
         st.markdown(f"**Scene Setting:** {st.session_state.scene}")
         st.markdown("### 📚 Generated SF Short Story")
         st.text_area("SF Story", st.session_state.story, height=400)
+
+        if st.toggle("Show full AP model timeline", key="show_ap_timeline"):
+            show_visualization(st.session_state.ap_history, window=None)
+
+        selection = st.session_state.story_selection
+        if selection.get("num_candidates", 1) > 1 and selection["method"] == "single":
+            st.warning(f"⚠️ {selection['reason'] or 'Candidates could not be compared.'} Candidate {selection['selected']} was kept.")
+        if selection.get("num_candidates", 1) > 1:
+            with st.expander(f"🏅 Selected candidate {selection['selected']} of {selection['num_candidates']}"):
+                if selection["method"] == "llm_judge":
+                    st.write(f"**Selected by LLM judge:** {selection['reason']}")
+                elif selection["method"] == "local_metrics":
+                    st.write("**Selected by local text metrics** (distinct-n, readability, vocabulary entropy)")
+                    st.dataframe({f"Candidate {i}": {k: round(v, 3) for k, v in scores.items()} for i, scores in sorted(selection["scores"].items())})
+                else:
+                    st.write("Candidates could not be compared, the first one was kept.")
         
-        with st.expander("📈 View Summary of 3-Stage Future Predictions"):
-            stages_info = ["Stage 1: Ferment Period", "Stage 2: Take-off Period", "Stage 3: Maturity Period"]
-            for i, stage_name in enumerate(stages_info):
-                st.markdown(f"**{stage_name}**")
-                st.info(st.session_state.descriptions[i])
+        with st.expander(f"📈 View Summary of {num_stages}-Stage Future Predictions"):
+            for i, description in enumerate(st.session_state.descriptions):
+                st.markdown(f"**Stage {i + 1}: {stage_period(i + 1, num_stages)[0]}**")
+                st.info(description)
     
     # ==================================================================
     # Generation Logic: Check data existence and generate if missing
     # ==================================================================
+    # --- Admission Control ---
+    if not st.session_state.story:
+        position = scheduler.admit(st.session_state.session_id)
+        if position:
+            # This run only sleeps and polls, so it must not count towards the step it waits for
+            run_step = "queued"
+            monitor.heartbeat(run_session_id, run_step)
+            st.info(f"⏳ The server is busy. Your run is number {position} in the queue and will start automatically.")
+            time.sleep(ADMISSION_POLL_SECONDS)
+            rerun()
+
     # --- Stage 1 Generation ---
     if len(st.session_state.ap_history) == 0:
         with st.status("Stage 1: Building AP model with web information collection via Tavily...", expanded=True) as status:
-            intro1, model1 = build_stage1_ap_with_tavily(st.session_state.client, st.session_state.tavily_client, st.session_state.topic, status)
+            intro1, model1 = build_stage1_ap_with_tavily(st.session_state.client, st.session_state.tavily_client, st.session_state.topic, status, st.session_state.session_id, get_knowledge_base())
+            status.update(label="Stage 1: Summarizing timeline...")
+            core1 = {name: model1.nodes[name].definition for name in CORE_ELEMENTS if name in model1.nodes}
+            summary1 = summarize_timeline(st.session_state.client, st.session_state.topic, 1, num_stages, "", intro1, core1)
             st.session_state.descriptions.append(intro1)
-            st.session_state.ap_history.append({"stage": 1, "ap_model": model1})
-        st.rerun()
+            st.session_state.timeline_summaries.append(summary1)
+            st.session_state.ap_history.append(StageRecord(1, model1))
+        rerun()
         
-    # --- Stage 2 Generation (Step by Step) ---
-    elif len(st.session_state.ap_history) == 1:
+    # --- Stage 2+ Generation (Step by Step) ---
+    elif len(st.session_state.ap_history) < num_stages:
+        stage = len(st.session_state.ap_history) + 1
+        previous_ap = st.session_state.ap_history[-1].ap_model
+        stage_context = build_stage_context(stage, num_stages, st.session_state.timeline_summaries[-1])
+
         # Agent Generation
         if not st.session_state.agents:
             with st.spinner("Generating expert AI agents for analysis..."):
                 st.session_state.agents = generate_agents(st.session_state.client, st.session_state.topic)
-            st.rerun()
+            rerun()
         
         # Element Generation
-        s2_results = st.session_state.stage_elements_results['stage2']
-        element_sequence = ["Technology and Resources", "Daily Spaces and User Experience", "Avant-garde Social Issues"]
-        if len(s2_results) < len(element_sequence):
-            elem_type = element_sequence[len(s2_results)]
-            with st.status(f"Stage 2: Generating '{elem_type}'...", expanded=True) as status:
+        stage_results = st.session_state.stage_elements_results[f'stage{stage}']
+        if len(stage_results) < len(CORE_ELEMENTS):
+            elem_type = CORE_ELEMENTS[len(stage_results)]
+            with st.status(f"Stage {stage}: Generating '{elem_type}'...", expanded=True) as status:
                 # Pass previous element results as context
-                context = {r['element_type']: r['final_decision']['final_selected_content'] for r in s2_results}
-                result = generate_single_element_with_iterations(st.session_state.client, status, st.session_state.topic, elem_type, st.session_state.ap_history[0]['ap_model'], st.session_state.agents, user_vision, context)
-                s2_results.append(result)
-            st.rerun()
+                context = selected_contents(stage_results)
+                result = generate_single_element_with_iterations(st.session_state.client, status, st.session_state.topic, elem_type, previous_ap, st.session_state.agents, user_vision, context, stage_context, st.session_state.session_id)
+                stage_results.append(transcript_store.spill(result, f"stage{stage}_{len(stage_results)}"))
+            rerun()
 
         # Build Complete AP Model
         else:
-            with st.status("Stage 2: Building complete AP model...", expanded=True) as status:
-                context = {r['element_type']: r['final_decision']['final_selected_content'] for r in s2_results}
-                status.update(label="Stage 2: Building complete AP model...")
-                model2 = build_complete_ap_model(st.session_state.client, st.session_state.topic, st.session_state.ap_history[0]['ap_model'], context, 2, user_vision)
-                status.update(label="Stage 2: Generating introduction...")
-                intro2 = generate_stage_introduction(st.session_state.client, st.session_state.topic, 2, context, user_vision)
-                st.session_state.descriptions.append(intro2)
-                st.session_state.ap_history.append({"stage": 2, "ap_model": model2})
-            st.rerun()
-
-    # --- Stage 3 Generation (Step by Step) ---
-    elif len(st.session_state.ap_history) == 2:
-        s3_results = st.session_state.stage_elements_results['stage3']
-        element_sequence = ["Technology and Resources", "Daily Spaces and User Experience", "Avant-garde Social Issues"]
-        if len(s3_results) < len(element_sequence):
-            elem_type = element_sequence[len(s3_results)]
-            with st.status(f"Stage 3: Generating '{elem_type}'...", expanded=True) as status:
-                context = {r['element_type']: r['final_decision']['final_selected_content'] for r in s3_results}
-                result = generate_single_element_with_iterations(st.session_state.client, status, st.session_state.topic, elem_type, st.session_state.ap_history[1]['ap_model'], st.session_state.agents, user_vision, context)
-                s3_results.append(result)
-            st.rerun()
-        else:
-            with st.status("Stage 3: Building complete AP model...", expanded=True) as status:
-                context2 = {r['element_type']: r['final_decision']['final_selected_content'] for r in s3_results}
-                model3 = build_complete_ap_model(st.session_state.client, st.session_state.topic, st.session_state.ap_history[1]['ap_model'], context2, 3, user_vision)
-                intro3 = generate_stage_introduction(st.session_state.client, st.session_state.topic, 3, context2, user_vision)
-                st.session_state.descriptions.append(intro3)
-                st.session_state.ap_history.append({"stage": 3, "ap_model": model3})
-            st.rerun()
+            with st.status(f"Stage {stage}: Building complete AP model...", expanded=True) as status:
+                context = selected_contents(stage_results)
+                model = build_incremental_ap_model(st.session_state.client, st.session_state.topic, previous_ap, context, stage, num_stages, user_vision, st.session_state.session_id)
+                status.update(label=f"Stage {stage}: Generating introduction...")
+                intro = generate_stage_introduction(st.session_state.client, st.session_state.topic, stage, num_stages, context, user_vision)
+                # The final stage's summary would never be read, so it is skipped
+                if stage < num_stages:
+                    status.update(label=f"Stage {stage}: Summarizing timeline...")
+                    summary = summarize_timeline(st.session_state.client, st.session_state.topic, stage, num_stages, st.session_state.timeline_summaries[-1], intro, context)
+                    st.session_state.timeline_summaries.append(summary)
+                st.session_state.descriptions.append(intro)
+                st.session_state.ap_history.append(StageRecord(stage, model))
+            rerun()
 
     # --- Story Generation ---
-    elif len(st.session_state.ap_history) == 3 and not st.session_state.story:
-        with st.spinner("Final stage: Generating SF story synopsis..."):
-            outline = generate_outline(st.session_state.client, st.session_state.topic, st.session_state.scene, st.session_state.ap_history)
-        with st.spinner("Final stage: Generating SF short story from synopsis..."):
-            story = generate_story(st.session_state.client, st.session_state.topic, outline)
-            st.session_state.story = story
+    elif not st.session_state.story:
+        num_candidates = st.session_state.story_candidates
+        label = "Final stage: Generating SF story synopsis and short story..." if num_candidates == 1 else f"Final stage: Generating {num_candidates} SF story candidates..."
+        with st.status(label, expanded=True) as status:
+            # The summary through stage N-2, which ends just before the story's beginning stage
+            background_summary = st.session_state.timeline_summaries[num_stages - 3]
+            best = generate_best_story(st.session_state.client, st.session_state.topic, st.session_state.scene, st.session_state.ap_history, background_summary, num_candidates, st.session_state.story_judge, status, st.session_state.session_id)
+            st.session_state.story = best["story"]
+            st.session_state.story_selection = best["selection"]
+        scheduler.release(st.session_state.session_id)
         st.success("✅ All generation processes completed!")
         time.sleep(1)
-        st.rerun()
+        rerun()
         
     # --- Final Page Action Buttons ---
     if st.session_state.story:
         st.markdown("---")
         st.subheader("Actions")
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             st.download_button(
                 label="📥 Download SF Story (.txt)",
@@ -658,17 +852,29 @@ else:
                 mime="text/plain"
             )
         with col2:
-            ap_json = json.dumps(st.session_state.ap_history, ensure_ascii=False, indent=2)
+            ap_json = json.dumps(history_to_dicts(st.session_state.ap_history), ensure_ascii=False, indent=2)
             st.download_button(
                 label="📥 Download AP Model (JSON)",
                 data=ap_json,
                 file_name=f"ap_model_{st.session_state.topic}.json",
                 mime="application/json"
             )
+        with col3:
+            st.download_button(
+                label="📥 Download AP Timeline (SVG)",
+                data=render_ap_timeline_svg(st.session_state.ap_history),
+                file_name=f"ap_model_{st.session_state.topic}.svg",
+                mime="image/svg+xml"
+            )
 
     # --- Reset Button ---
     st.markdown("---")
     if st.button("🔄 Generate with New Theme"):
+        transcript_store.clear()
+        scheduler.release(st.session_state.session_id)
+        monitor.end_session(st.session_state.session_id)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
-        st.rerun()
\ No newline at end of file
+        rerun()
+
+monitor.finish_run(run_session_id, run_step, time.perf_counter() - run_started)
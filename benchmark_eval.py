@@ -1,31 +1,42 @@
-import nltk
-import numpy as np
 import json
 import math
 import re
 import collections
-from nltk.util import ngrams
-from nltk.tokenize import word_tokenize
-from nltk.corpus import cmudict
-import textstat
 
-nltk.download('punkt')
-nltk.download('cmudict')
+# nltk and textstat are imported on first use so importing this module stays cheap
+NLTK_RESOURCES = {"cmudict": "corpora/cmudict"}
 
-class StoryEvaluator:
-    def __init__(self):
+def download_nltk_data():
+    """Fetch the nltk data this module needs; run once at setup, never while scoring"""
+    import nltk
+    for name, path in NLTK_RESOURCES.items():
         try:
-            self.d = cmudict.dict()  # For calculating syllables
+            nltk.data.find(path)
         except LookupError:
-            print("Downloading cmudict...")
-            nltk.download('cmudict')
-            self.d = cmudict.dict()
+            print(f"Downloading {name}...")
+            if not nltk.download(name, quiet=True):
+                raise LookupError(f"Could not download nltk resource '{name}'")
+
+class StoryEvaluator:
+    def __init__(self):
+        self._cmudict = None
+
+    @property
+    def d(self):
+        """cmudict for calculating syllables, loaded on first access"""
+        if self._cmudict is None:
+            from nltk.corpus import cmudict
+            # Raises LookupError if download_nltk_data() has not been run
+            self._cmudict = cmudict.dict()
+        return self._cmudict
     
     def evaluate_story(self, text):
         """Evaluate various metrics of story text"""
+        from nltk.tokenize import word_tokenize
         # Preprocess text - use simple sentence splitting method to replace sent_tokenize
         sentences = re.split(r'(?<=[.!?])\s+', text)
-        words = word_tokenize(text.lower())
+        # preserve_line skips nltk's own sentence splitter, so no punkt data is needed
+        words = [word for sentence in sentences for word in word_tokenize(sentence.lower(), preserve_line=True)]
         # Filter punctuation marks
         words = [word for word in words if word.isalpha()]
         
@@ -35,16 +46,19 @@ class StoryEvaluator:
             "distinct_1": self._calculate_distinct_n(words, 1),
             "distinct_2": self._calculate_distinct_n(words, 2),
             "perplexity": self._calculate_perplexity(words),
+            "word_count": len(words),
         }
         
         return results
     
     def _calculate_flesch_kincaid(self, text):
         """Calculate Flesch-Kincaid readability index"""
+        import textstat
         return textstat.flesch_kincaid_grade(text)
     
     def _calculate_distinct_n(self, words, n):
         """Calculate Distinct-n metric"""
+        from nltk.util import ngrams
         if len(words) < n:
             return 0
         ngram_list = list(ngrams(words, n))
@@ -73,49 +87,82 @@ class StoryEvaluator:
         # Perplexity = 2^entropy
         return math.pow(2, entropy) / 10
 
+_evaluator = None
+
 def evaluate_text(story_text):
     """Evaluate given text and return various metrics"""
-    evaluator = StoryEvaluator()
-    results = evaluator.evaluate_story(story_text)
+    # One evaluator per process; building it is the expensive part
+    global _evaluator
+    if _evaluator is None:
+        _evaluator = StoryEvaluator()
+    results = _evaluator.evaluate_story(story_text)
     
     return results
 
 
-ap_fk = 0
-ap_dist1 = 0
-ap_dist2 = 0
-ap_perplexity = 0
-direct_fk = 0
-direct_dist1 = 0
-direct_dist2 = 0
-direct_perplexity = 0
-
-# Evaluate stories
-temp = ['drone_', 'earphone_', 'smartphone_']
-
-for i in temp:
-    for j in range(10):
-        file_name = "samples/" + i + str(j) + '.json'
-        with open(file_name, 'r') as f:
-            data = json.load(f)
-            ap_story = data[0]["story"]
-            direct_story = data[1]["story"]
-            ap_benchmark = evaluate_text(ap_story)
-            direct_benchmark = evaluate_text(direct_story)
-            ap_fk += ap_benchmark["flesch_kincaid"]
-            ap_dist1 += ap_benchmark["distinct_1"]
-            ap_dist2 += ap_benchmark["distinct_2"]
-            ap_perplexity += ap_benchmark["perplexity"]
-            direct_fk += direct_benchmark["flesch_kincaid"]
-            direct_dist1 += direct_benchmark["distinct_1"]
-            direct_dist2 += direct_benchmark["distinct_2"]
-            direct_perplexity += direct_benchmark["perplexity"]
-
-print("AP-based flesch kincaid: " + str(ap_fk/30))
-print("AP-based distinct_1: " + str(ap_dist1/30))
-print("AP-based distinct_2: " + str(ap_dist2/30))
-print("AP-based perplexity: " + str(ap_perplexity/30))
-print("Direct flesch kincaid: " + str(direct_fk/30))
-print("Direct distinct_1: " + str(direct_dist1/30))
-print("Direct distinct_2: " + str(direct_dist2/30))
-print("Direct perplexity: " + str(direct_perplexity/30))
\ No newline at end of file
+# Grade level the stories aim for; readability falls off linearly away from it
+TARGET_GRADE = 8.0
+# Stories are asked for about 500 words; shorter ones are scaled down in proportion
+MIN_STORY_WORDS = 400
+
+def quality_score(metrics):
+    """Combine the local metrics into one number, higher is better"""
+    readability = max(0.0, 1 - abs(metrics["flesch_kincaid"] - TARGET_GRADE) / 10)
+    # Perplexity is inf for texts too short to measure, which says nothing good about them
+    perplexity = metrics["perplexity"] if math.isfinite(metrics["perplexity"]) else 0.0
+    vocabulary = min(perplexity, 30) / 30
+    # Distinct-n is close to 1 for any short text, so refusals and truncated stories must not win on it
+    length = min(1.0, metrics["word_count"] / MIN_STORY_WORDS)
+    return (metrics["distinct_1"] + metrics["distinct_2"] + readability + vocabulary) * length
+
+def score_story(story_text):
+    """Evaluate a story and add its quality score; safe to run in a worker process"""
+    results = evaluate_text(story_text)
+    results["score"] = quality_score(results)
+    return results
+
+
+def main():
+    download_nltk_data()
+    ap_fk = 0
+    ap_dist1 = 0
+    ap_dist2 = 0
+    ap_perplexity = 0
+    direct_fk = 0
+    direct_dist1 = 0
+    direct_dist2 = 0
+    direct_perplexity = 0
+
+    # Evaluate stories
+    temp = ['drone_', 'earphone_', 'smartphone_']
+
+    for i in temp:
+        for j in range(10):
+            file_name = "samples/" + i + str(j) + '.json'
+            with open(file_name, 'r') as f:
+                data = json.load(f)
+                ap_story = data[0]["story"]
+                direct_story = data[1]["story"]
+                ap_benchmark = evaluate_text(ap_story)
+                direct_benchmark = evaluate_text(direct_story)
+                ap_fk += ap_benchmark["flesch_kincaid"]
+                ap_dist1 += ap_benchmark["distinct_1"]
+                ap_dist2 += ap_benchmark["distinct_2"]
+                ap_perplexity += ap_benchmark["perplexity"]
+                direct_fk += direct_benchmark["flesch_kincaid"]
+                direct_dist1 += direct_benchmark["distinct_1"]
+                direct_dist2 += direct_benchmark["distinct_2"]
+                direct_perplexity += direct_benchmark["perplexity"]
+
+    print("AP-based flesch kincaid: " + str(ap_fk/30))
+    print("AP-based distinct_1: " + str(ap_dist1/30))
+    print("AP-based distinct_2: " + str(ap_dist2/30))
+    print("AP-based perplexity: " + str(ap_perplexity/30))
+    print("Direct flesch kincaid: " + str(direct_fk/30))
+    print("Direct distinct_1: " + str(direct_dist1/30))
+    print("Direct distinct_2: " + str(direct_dist2/30))
+    print("Direct perplexity: " + str(direct_perplexity/30))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# =======================================================
+# Typed data model for AP models, agent proposals and judgments
+# =======================================================
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field, fields
+
+AP_MODEL_STRUCTURE = {
+    "objects": {
+        "Avant-garde Social Issues": "Social issues caused by paradigms of technology and resources",
+        "People's Values": "Values and ideals recognized by progressive people",
+        "Social Issues": "Issues recognized and to be solved in society",
+        "Technology and Resources": "Technology and resources organized for problem solving",
+        "Daily Spaces and User Experience": "Physical spaces and user experiences through products/services",
+        "Institutions": "Systems and rules that facilitate habits and business"
+    },
+    "arrows": {
+        "Media": {"from": "Institutions", "to": "Social Issues", "description": "Media exposing institutional defects"},
+        "Community Formation": {"from": "Avant-garde Social Issues", "to": "Social Issues", "description": "Communities addressing avant-garde issues"},
+        "Cultural Arts Promotion": {"from": "Avant-garde Social Issues", "to": "People's Values", "description": "Exhibition and transmission of issues through art"},
+        "Standardization": {"from": "Institutions", "to": "Technology and Resources", "description": "Standardization of institutions into technology/resources"},
+        "Communication": {"from": "Social Issues", "to": "People's Values", "description": "Issue transmission via SNS etc."},
+        "Organization": {"from": "Social Issues", "to": "Technology and Resources", "description": "Formation of organizations for problem solving"},
+        "Meaning Attribution": {"from": "People's Values", "to": "Daily Spaces and User Experience", "description": "Reasons for using products/services based on values"},
+        "Products/Services": {"from": "Technology and Resources", "to": "Daily Spaces and User Experience", "description": "Creation of products/services using technology"},
+        "Habituation": {"from": "People's Values", "to": "Institutions", "description": "Institutionalization of habits based on values"},
+        "Paradigm": {"from": "Technology and Resources", "to": "Avant-garde Social Issues", "description": "New social issues from dominant technology"},
+        "Business Ecosystem": {"from": "Daily Spaces and User Experience", "to": "Institutions", "description": "Networks of business stakeholders"},
+        "Art (Social Criticism)": {"from": "Daily Spaces and User Experience", "to": "Avant-garde Social Issues", "description": "Presenting issues from discomfort with daily life"}
+    }
+}
+
+# ========== Pipeline Shape ==========
+# Shared by the app and by planning tools that walk the pipeline without running it
+CORE_ELEMENTS = ["Technology and Resources", "Daily Spaces and User Experience", "Avant-garde Social Issues"]
+DEFAULT_NUM_STAGES = 3
+MAX_NUM_STAGES = 8
+NUM_ITERATIONS = 3
+
+def find_affected_arrows(updated_objects) -> list:
+    """Return the arrows whose source or target is one of the updated objects"""
+    return [name for name, info in AP_MODEL_STRUCTURE["arrows"].items() if info["from"] in updated_objects or info["to"] in updated_objects]
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+def _from_dict(cls, data: dict):
+    """Build a flat record from an LLM dict, ignoring unknown keys and stringifying values"""
+    data = data if isinstance(data, dict) else {}
+    return cls(**{f.name: _text(data.get(f.name)) for f in fields(cls)})
+
+def compact_json(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+# ========== AP Model ==========
+@dataclass(slots=True)
+class APNode:
+    type: str
+    definition: str = ""
+    example: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "APNode":
+        return _from_dict(cls, data)
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "definition": self.definition, "example": self.example}
+
+@dataclass(slots=True)
+class APArrow:
+    type: str
+    source: str = ""
+    target: str = ""
+    definition: str = ""
+    example: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "APArrow":
+        return _from_dict(cls, data)
+
+    def to_dict(self) -> dict:
+        return {"source": self.source, "target": self.target, "type": self.type, "definition": self.definition, "example": self.example}
+
+@dataclass(slots=True)
+class APModel:
+    """Objects and arrows keyed by element name for O(1) lookup"""
+    nodes: dict = field(default_factory=dict)
+    arrows: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "APModel":
+        """Accept the {"nodes": [...], "arrows": [...]} layout produced by the LLM prompts"""
+        nodes = (APNode.from_dict(n) for n in data.get("nodes", []) if isinstance(n, dict) and n.get("type"))
+        arrows = (APArrow.from_dict(a) for a in data.get("arrows", []) if isinstance(a, dict) and a.get("type"))
+        return cls({n.type: n for n in nodes}, {a.type: a for a in arrows})
+
+    def node(self, name: str):
+        return self.nodes.get(name)
+
+    def arrow(self, name: str):
+        return self.arrows.get(name)
+
+    def to_dict(self) -> dict:
+        return {"nodes": [n.to_dict() for n in self.nodes.values()], "arrows": [a.to_dict() for a in self.arrows.values()]}
+
+    def to_json(self) -> str:
+        return compact_json(self.to_dict())
+
+@dataclass(slots=True)
+class StageRecord:
+    stage: int
+    ap_model: APModel
+
+    def to_dict(self) -> dict:
+        return {"stage": self.stage, "ap_model": self.ap_model.to_dict()}
+
+def history_to_dicts(ap_history: list) -> list:
+    return [record.to_dict() for record in ap_history]
+
+# ========== Agent Proposals & Judgments ==========
+@dataclass(slots=True)
+class Proposal:
+    agent_name: str
+    proposal: str
+
+    def to_dict(self) -> dict:
+        return {"agent_name": self.agent_name, "proposal": self.proposal}
+
+@dataclass(slots=True)
+class Judgment:
+    selected_proposal: str = ""
+    selected_content: str = ""
+    selection_reason: str = ""
+    creativity_score: str = ""
+    future_vision_score: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Judgment":
+        return _from_dict(cls, data)
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass(slots=True)
+class FinalDecision:
+    final_selected_iteration: str = ""
+    final_selection_reason: str = ""
+    final_selected_content: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FinalDecision":
+        return _from_dict(cls, data)
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass(slots=True)
+class IterationRecord:
+    iteration_number: int
+    proposals: list
+    judgment: Judgment
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IterationRecord":
+        proposals = [Proposal(p["agent_name"], p["proposal"]) for p in data.get("all_agent_proposals", [])]
+        return cls(int(data["iteration_number"]), proposals, Judgment.from_dict(data.get("judgment", {})))
+
+    def to_dict(self) -> dict:
+        return {"iteration_number": self.iteration_number, "all_agent_proposals": [p.to_dict() for p in self.proposals], "judgment": self.judgment.to_dict()}
+
+@dataclass(slots=True)
+class ElementResult:
+    """Outcome of the multi-agent iterations for one element.
+
+    `iterations` holds the full transcript until it is spilled to a TranscriptStore,
+    after which only `transcript_path` and the final decision stay in memory.
+    """
+    element_type: str
+    final_decision: FinalDecision = None
+    iterations: list = None
+    iteration_count: int = 0
+    transcript_path: str = ""
+    error: str = ""
+
+    @property
+    def content(self) -> str:
+        return self.final_decision.final_selected_content if self.final_decision else ""
+
+def selected_contents(element_results: list) -> dict:
+    return {r.element_type: r.content for r in element_results if r.final_decision}
+
+# ========== In-Session Retention ==========
+# Transcript directories untouched for this long belong to closed or timed-out sessions
+TRANSCRIPT_RETENTION_SECONDS = 24 * 3600
+# The store is created on every script run, so the sweep runs at most this often per process
+TRANSCRIPT_SWEEP_INTERVAL_SECONDS = 600
+_last_sweep = {}
+
+class TranscriptStore:
+    """Keeps full iteration transcripts on disk so session state only holds summaries"""
+
+    def __init__(self, session_id: str, root: str = None):
+        self.root = root or os.path.join(tempfile.gettempdir(), "sf_generator_transcripts")
+        self.directory = os.path.join(self.root, session_id)
+        now = time.time()
+        if now - _last_sweep.get(self.root, 0) > TRANSCRIPT_SWEEP_INTERVAL_SECONDS:
+            _last_sweep[self.root] = now
+            self.sweep(now - TRANSCRIPT_RETENTION_SECONDS)
+
+    def sweep(self, cutoff: float) -> int:
+        """Remove other sessions' transcript directories last modified before `cutoff`"""
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.path != self.directory and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def spill(self, result: ElementResult, name: str) -> ElementResult:
+        """Write the iterations of `result` to disk and drop them from memory"""
+        if result.iterations is None:
+            return result
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(compact_json([it.to_dict() for it in result.iterations]))
+        result.iteration_count = len(result.iterations)
+        result.iterations = None
+        result.transcript_path = path
+        return result
+
+    def load(self, result: ElementResult) -> list:
+        if result.iterations is not None:
+            return result.iterations
+        if not result.transcript_path or not os.path.exists(result.transcript_path):
+            return []
+        with open(result.transcript_path, encoding="utf-8") as f:
+            return [IterationRecord.from_dict(it) for it in json.load(f)]
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,138 @@
+# =======================================================
+# Pre-flight cost & latency estimator for a generation run
+# =======================================================
+import argparse
+import json
+import math
+from dataclasses import dataclass, field
+
+from data_model import AP_MODEL_STRUCTURE, CORE_ELEMENTS, DEFAULT_NUM_STAGES, NUM_ITERATIONS, find_affected_arrows
+from scheduler import MAX_WORKERS
+from telemetry import recorder
+
+# Prior (prompt_tokens, completion_tokens, latency_seconds) per call type, used until telemetry has enough samples
+DEFAULT_CALL_PROFILES = {
+    "object_question": (120, 30, 1.2),
+    "arrow_question": (160, 35, 1.3),
+    "search": (0, 0, 2.5),
+    "stage1_element": (400, 80, 2.0),
+    "stage1_intro": (2500, 70, 2.0),
+    "timeline_summary": (350, 160, 3.0),
+    "agents": (1800, 300, 5.0),
+    "agent_proposal": (3000, 45, 2.0),
+    "judge": (1900, 150, 4.0),
+    "final_judge": (2400, 80, 3.0),
+    "node_update": (1700, 80, 2.5),
+    "arrow_update": (1760, 90, 2.5),
+    "carry_over_update": (2200, 400, 7.0),
+    "stage_intro": (1700, 45, 1.5),
+    "outline": (3500, 600, 15.0),
+    "story": (2200, 750, 20.0),
+    "story_judge": (4500, 60, 4.0),
+}
+MIN_SAMPLES = 3
+# USD per 1M input/output tokens for gpt-4o, and per Tavily basic search
+PRICE_PER_M_INPUT = 2.50
+PRICE_PER_M_OUTPUT = 10.00
+PRICE_PER_SEARCH = 0.008
+
+@dataclass(slots=True)
+class PlannedPhase:
+    """One pipeline step: how many calls it makes and its longest sequential chain.
+
+    Each entry of `critical_path` is a tuple of call types that run concurrently;
+    the step takes as long as the slowest of them.
+    """
+    name: str
+    calls: dict
+    critical_path: list
+
+@dataclass(slots=True)
+class RunEstimate:
+    calls_by_type: dict
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    critical_path_seconds: float
+    phase_seconds: dict = field(default_factory=dict)
+    calibrated_call_types: list = field(default_factory=list)
+
+    @property
+    def llm_calls(self) -> int:
+        return sum(count for call_type, count in self.calls_by_type.items() if call_type != "search")
+
+    @property
+    def searches(self) -> int:
+        return self.calls_by_type.get("search", 0)
+
+    def to_dict(self) -> dict:
+        return {"llm_calls": self.llm_calls, "searches": self.searches, "calls_by_type": self.calls_by_type, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "cost_usd": round(self.cost_usd, 4), "critical_path_seconds": round(self.critical_path_seconds, 1),
+                "phase_seconds": {k: round(v, 1) for k, v in self.phase_seconds.items()}, "calibrated_call_types": self.calibrated_call_types}
+
+def plan_run(num_stages: int = DEFAULT_NUM_STAGES, num_agents: int = 3, story_candidates: int = 1, story_judge: bool = False, stage1_cached: bool = False) -> list:
+    """Walk the generation pipeline in planning mode and return its phases without making any calls"""
+    num_objects, num_arrows = len(AP_MODEL_STRUCTURE["objects"]), len(AP_MODEL_STRUCTURE["arrows"])
+    # Assumes an otherwise idle server, where one session may use every scheduler worker
+    waves = math.ceil((num_objects + num_arrows) / MAX_WORKERS)
+    if stage1_cached:
+        # A knowledge base hit leaves only the timeline summary
+        stage1 = PlannedPhase("Stage 1", {"timeline_summary": 1}, [("timeline_summary",)])
+    else:
+        stage1 = PlannedPhase(
+            "Stage 1",
+            {"object_question": num_objects, "arrow_question": num_arrows, "search": num_objects + num_arrows, "stage1_element": num_objects + num_arrows, "stage1_intro": 1, "timeline_summary": 1},
+            [("object_question", "arrow_question"), ("search",), ("stage1_element",)] * waves + [("stage1_intro",), ("timeline_summary",)],
+        )
+    phases = [stage1, PlannedPhase("Agents", {"agents": 1}, [("agents",)])]
+
+    affected = len(find_affected_arrows(CORE_ELEMENTS))
+    carry_over = 1 if affected < num_arrows or len(CORE_ELEMENTS) < num_objects else 0
+    for stage in range(2, num_stages + 1):
+        # The final stage is not summarized because nothing reads its summary
+        summary = int(stage < num_stages)
+        per_element = [("agent_proposal",), ("judge",)] * NUM_ITERATIONS + [("final_judge",)]
+        build = ("node_update", "arrow_update") + (("carry_over_update",) if carry_over else ())
+        phases.append(PlannedPhase(
+            f"Stage {stage}",
+            {"agent_proposal": len(CORE_ELEMENTS) * NUM_ITERATIONS * num_agents, "judge": len(CORE_ELEMENTS) * NUM_ITERATIONS, "final_judge": len(CORE_ELEMENTS),
+             "node_update": len(CORE_ELEMENTS), "arrow_update": affected, "carry_over_update": carry_over, "stage_intro": 1, "timeline_summary": summary},
+            per_element * len(CORE_ELEMENTS) + [build, ("stage_intro",)] + [("timeline_summary",)] * summary,
+        ))
+    # Candidates are generated concurrently, so K only widens the phase; the judge adds one step when K > 1
+    judged = story_judge and story_candidates > 1
+    phases.append(PlannedPhase("Story", {"outline": story_candidates, "story": story_candidates, "story_judge": int(judged)},
+                               [("outline",), ("story",)] + ([("story_judge",)] if judged else [])))
+    return phases
+
+def call_profiles(stats: dict = None) -> tuple:
+    """Return ({call_type: (prompt, completion, latency)}, calibrated call types) from telemetry, falling back to priors"""
+    stats = recorder.stats() if stats is None else stats
+    profiles, calibrated = dict(DEFAULT_CALL_PROFILES), []
+    for call_type, s in stats.items():
+        if call_type in profiles and s["count"] >= MIN_SAMPLES:
+            profiles[call_type] = (s["prompt_tokens"], s["completion_tokens"], s["latency"])
+            calibrated.append(call_type)
+    return profiles, sorted(calibrated)
+
+def estimate_run(num_stages: int = DEFAULT_NUM_STAGES, num_agents: int = 3, stats: dict = None, story_candidates: int = 1, story_judge: bool = False, stage1_cached: bool = False) -> RunEstimate:
+    profiles, calibrated = call_profiles(stats)
+    calls_by_type, phase_seconds = {}, {}
+    for phase in plan_run(num_stages, num_agents, story_candidates, story_judge, stage1_cached):
+        for call_type, count in phase.calls.items():
+            if count: calls_by_type[call_type] = calls_by_type.get(call_type, 0) + count
+        phase_seconds[phase.name] = sum(max(profiles[call_type][2] for call_type in step) for step in phase.critical_path)
+    prompt_tokens = sum(profiles[t][0] * n for t, n in calls_by_type.items())
+    completion_tokens = sum(profiles[t][1] * n for t, n in calls_by_type.items())
+    cost = prompt_tokens / 1e6 * PRICE_PER_M_INPUT + completion_tokens / 1e6 * PRICE_PER_M_OUTPUT + calls_by_type.get("search", 0) * PRICE_PER_SEARCH
+    return RunEstimate(calls_by_type, round(prompt_tokens), round(completion_tokens), cost, sum(phase_seconds.values()), phase_seconds, calibrated)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate calls, tokens, cost and time of a generation run")
+    parser.add_argument("--stages", type=int, default=DEFAULT_NUM_STAGES)
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--story-candidates", type=int, default=1)
+    parser.add_argument("--story-judge", action="store_true")
+    parser.add_argument("--stage1-cached", action="store_true", help="Assume the topic is already in the Stage 1 knowledge base")
+    args = parser.parse_args()
+    print(json.dumps(estimate_run(args.stages, args.agents, story_candidates=args.story_candidates, story_judge=args.story_judge, stage1_cached=args.stage1_cached).to_dict(), indent=2))
@@ -0,0 +1,245 @@
+# =======================================================
+# Precomputed Stage 1 knowledge base with fuzzy topic lookup
+# =======================================================
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+from data_model import AP_MODEL_STRUCTURE, APModel
+
+KB_DIR = os.environ.get("SF_KB_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base"))
+STALE_AFTER_SECONDS = 30 * 24 * 3600
+REFRESH_INTERVAL_SECONDS = 3600
+REFRESH_ENABLED = os.environ.get("SF_KB_REFRESH", "1") != "0"
+# A typo is tolerated only in one word this long, and only as a single edit that keeps the first letter
+MIN_TYPO_WORD_LENGTH = 6
+# Topics the background refresher keeps warm even before anyone has asked for them
+SEED_TOPICS = ["drone", "earphone", "smartphone"]
+
+_STOPWORDS = {"a", "an", "the", "of", "for", "and", "in", "on", "to"}
+
+def normalize_topic(topic: str) -> str:
+    """Lowercase, drop punctuation and filler words, and singularize plain plurals"""
+    words = re.sub(r"[^\w\s]", " ", topic.lower()).split()
+    words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words if w not in _STOPWORDS]
+    return " ".join(words)
+
+def _edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance counting an adjacent transposition as one edit"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+def is_typo_of(key: str, candidate: str) -> bool:
+    """True if two normalized topics differ only by one small typo in one long word.
+
+    Different digits or short words ("5G"/"6G", "VR"/"AR") always count as different topics.
+    """
+    words, candidate_words = key.split(), candidate.split()
+    if len(words) != len(candidate_words):
+        return False
+    differing = [(a, b) for a, b in zip(words, candidate_words) if a != b]
+    if len(differing) != 1:
+        return False
+    a, b = differing[0]
+    if min(len(a), len(b)) < MIN_TYPO_WORD_LENGTH or a[0] != b[0] or any(c.isdigit() for c in a + b):
+        return False
+    return _edit_distance(a, b) == 1
+
+class Stage1KnowledgeBase:
+    """Finished Stage 1 AP models and introductions, one JSON file per topic plus an index"""
+
+    def __init__(self, directory: str = KB_DIR):
+        self.directory = directory
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_signature = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self._index_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_index(self, reload: bool = False) -> dict:
+        """Cached index, re-read when another process (e.g. the CLI) has replaced index.json.
+
+        Callers that modify the index pass reload=True so they build on the latest copy on disk.
+        """
+        signature = self._signature()
+        if reload or self._index is None or signature != self._index_signature:
+            try:
+                with open(self._index_path, encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._index_signature = signature
+        return self._index
+
+    def _write_index(self, index: dict):
+        self._write_json(self._index_path, index)
+        self._index, self._index_signature = index, self._signature()
+
+    def _write_json(self, path: str, data):
+        # Write then rename so concurrent readers never see a partial file
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def match(self, topic: str):
+        """Return the index key for `topic`: an exact normalized key, an explicit alias, or a single-typo variant"""
+        key = normalize_topic(topic)
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                return key
+            compact = key.replace(" ", "")
+            for candidate, meta in index.items():
+                # Spacing and hyphenation ("smart-phone") do not make a different topic
+                if key in meta.get("aliases", ()) or candidate.replace(" ", "") == compact:
+                    return candidate
+            typos = [candidate for candidate in index if is_typo_of(key, candidate)]
+        # An ambiguous typo could be either topic, so it matches neither
+        return typos[0] if len(typos) == 1 else None
+
+    def add_alias(self, topic: str, alias: str) -> bool:
+        """Make `alias` look up the entry stored for `topic`"""
+        key, alias_key = normalize_topic(topic), normalize_topic(alias)
+        with self._lock:
+            index = self._load_index(reload=True)
+            if key not in index or not alias_key or alias_key in index:
+                return False
+            aliases = index[key].setdefault("aliases", [])
+            if alias_key not in aliases:
+                aliases.append(alias_key)
+                self._write_index(index)
+        return True
+
+    def get(self, topic: str):
+        """Return (matched_topic, introduction, APModel) for a known topic, or None"""
+        key = self.match(topic)
+        if key is None:
+            return None
+        with self._lock:
+            meta = self._load_index().get(key)
+        # Removed between match() and here
+        if meta is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, meta["file"]), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["topic"], entry["introduction"], APModel.from_dict(entry["ap_model"])
+
+    def put(self, topic: str, introduction: str, ap_model: APModel) -> bool:
+        """Store a Stage 1 result; incomplete models are refused so they never replace a good entry"""
+        key = normalize_topic(topic)
+        complete = all(name in ap_model.nodes for name in AP_MODEL_STRUCTURE["objects"]) and all(name in ap_model.arrows for name in AP_MODEL_STRUCTURE["arrows"])
+        if not key or not complete:
+            return False
+        file_name = re.sub(r"\W+", "_", key) + ".json"
+        now = time.time()
+        self._write_json(os.path.join(self.directory, file_name), {"topic": topic, "introduction": introduction, "ap_model": ap_model.to_dict(), "updated_at": now})
+        with self._lock:
+            index = self._load_index(reload=True)
+            index[key] = {"topic": topic, "file": file_name, "updated_at": now, "aliases": index.get(key, {}).get("aliases", [])}
+            self._write_index(index)
+        return True
+
+    def remove(self, topic: str) -> bool:
+        key = normalize_topic(topic)
+        with self._lock:
+            index = self._load_index(reload=True)
+            meta = index.pop(key, None)
+            if meta is None:
+                return False
+            self._write_index(index)
+        try: os.remove(os.path.join(self.directory, meta["file"]))
+        except OSError: pass
+        return True
+
+    def entries(self) -> dict:
+        with self._lock:
+            return dict(self._load_index())
+
+    def stale_topics(self, max_age: float = STALE_AFTER_SECONDS, seed_topics: list = ()) -> list:
+        """Topics whose entry is older than `max_age`, followed by seed topics with no entry yet"""
+        now = time.time()
+        index = self.entries()
+        stale = [meta["topic"] for meta in index.values() if now - meta["updated_at"] > max_age]
+        return stale + [t for t in seed_topics if normalize_topic(t) not in index]
+
+class BackgroundRefresher(threading.Thread):
+    """Rebuilds stale and missing seed entries off the request path.
+
+    `build_stage1` is called as build_stage1(topic) -> (introduction, APModel).
+    """
+
+    def __init__(self, knowledge_base: Stage1KnowledgeBase, build_stage1, interval: float = REFRESH_INTERVAL_SECONDS, seed_topics: list = SEED_TOPICS):
+        super().__init__(name="stage1-kb-refresher", daemon=True)
+        self.knowledge_base = knowledge_base
+        self.build_stage1 = build_stage1
+        self.interval = interval
+        self.seed_topics = seed_topics
+        self._stop_event = threading.Event()
+
+    def refresh_once(self) -> list:
+        refreshed = []
+        for topic in self.knowledge_base.stale_topics(seed_topics=self.seed_topics):
+            if self._stop_event.is_set():
+                break
+            try:
+                introduction, ap_model = self.build_stage1(topic)
+            except Exception as exc:
+                print(f"Knowledge base refresh failed for '{topic}': {exc}")
+                continue
+            if self.knowledge_base.put(topic, introduction, ap_model):
+                refreshed.append(topic)
+            else:
+                print(f"Knowledge base refresh for '{topic}' was incomplete; keeping the previous entry")
+        return refreshed
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.refresh_once()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the Stage 1 knowledge base")
+    parser.add_argument("command", choices=["list", "match", "alias", "remove"])
+    parser.add_argument("topic", nargs="?")
+    parser.add_argument("alias", nargs="?", help="Another name for the topic (alias command only)")
+    args = parser.parse_args()
+    kb = Stage1KnowledgeBase()
+    if args.command == "list":
+        for key, meta in sorted(kb.entries().items()):
+            age_days = (time.time() - meta["updated_at"]) / 86400
+            aliases = f"\taliases: {', '.join(meta['aliases'])}" if meta.get("aliases") else ""
+            print(f"{key}\t{meta['topic']}\t{age_days:.1f} days old{aliases}")
+    elif not args.topic:
+        parser.error(f"'{args.command}' needs a topic")
+    elif args.command == "match":
+        print(kb.match(args.topic) or "no match")
+    elif args.command == "alias":
+        if not args.alias:
+            parser.error("'alias' needs a topic and an alias")
+        print("added" if kb.add_alias(args.topic, args.alias) else "topic not found or alias already taken")
+    else:
+        print("removed" if kb.remove(args.topic) else "not found")
@@ -0,0 +1,121 @@
+# =======================================================
+# Live run monitoring: sessions, rerun durations and a sampling profiler
+# =======================================================
+import bisect
+import os
+import sys
+import threading
+import time
+
+# Upper bounds (seconds) of the rerun duration histogram buckets; the last bucket is open-ended
+RERUN_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+# Sessions not seen for this long are dropped from the live view
+SESSION_TTL_SECONDS = 900
+SAMPLE_INTERVAL_SECONDS = 0.01
+# Threads that execute the script run and the pipeline calls
+PROFILED_THREAD_PREFIXES = ("ScriptRunner", "sf-scheduler")
+
+def bucket_label(index: int) -> str:
+    return f"≤{RERUN_BUCKETS[index]}s" if index < len(RERUN_BUCKETS) else f">{RERUN_BUCKETS[-1]}s"
+
+class PipelineMonitor:
+    """Where every live session is in the generation state machine and how long its script runs take"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> {"topic", "step", "started", "last_seen", "runs"}
+        self._histograms = {}  # step -> counts per RERUN_BUCKETS bucket
+
+    def heartbeat(self, session_id: str, step: str, topic: str = ""):
+        now = time.time()
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {"topic": topic, "step": step, "started": now, "last_seen": now, "runs": 0})
+            session.update(step=step, last_seen=now, topic=topic or session["topic"])
+
+    def finish_run(self, session_id: str, step: str, duration: float):
+        with self._lock:
+            counts = self._histograms.setdefault(step, [0] * (len(RERUN_BUCKETS) + 1))
+            counts[bisect.bisect_left(RERUN_BUCKETS, duration)] += 1
+            if session_id in self._sessions:
+                self._sessions[session_id]["runs"] += 1
+
+    def end_session(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sessions(self) -> dict:
+        now = time.time()
+        with self._lock:
+            for session_id in [s for s, info in self._sessions.items() if now - info["last_seen"] > SESSION_TTL_SECONDS]:
+                del self._sessions[session_id]
+            return {session_id: dict(info) for session_id, info in self._sessions.items()}
+
+    def histograms(self) -> dict:
+        """Return {step: {bucket_label: count}} of script run durations"""
+        with self._lock:
+            return {step: {bucket_label(i): n for i, n in enumerate(counts)} for step, counts in self._histograms.items()}
+
+class SamplingProfiler:
+    """Samples the stacks of script-run and scheduler threads with sys._current_frames() while enabled"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS, thread_prefixes: tuple = PROFILED_THREAD_PREFIXES):
+        self.interval = interval
+        self.thread_prefixes = thread_prefixes
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._self_counts = {}
+        self._total_counts = {}
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._self_counts, self._total_counts, self.samples = {}, {}, 0
+            self.started_at = time.time()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="sf-sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if not names.get(ident, "").startswith(self.thread_prefixes):
+                    continue
+                # Idle scheduler workers park in threading.Condition.wait; they are not doing work
+                if frame.f_code.co_filename.endswith("threading.py"):
+                    continue
+                labels = []
+                while frame is not None:
+                    code = frame.f_code
+                    # Thread bootstrap frames are in every stack and say nothing about where time goes
+                    if not code.co_filename.endswith("threading.py"):
+                        labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(labels)
+            with self._lock:
+                for labels in stacks:
+                    self._self_counts[labels[0]] = self._self_counts.get(labels[0], 0) + 1
+                    for label in set(labels):
+                        self._total_counts[label] = self._total_counts.get(label, 0) + 1
+                self.samples += len(stacks)
+
+    def top(self, limit: int = 25) -> list:
+        """Return [(function, self samples, total samples)], hottest functions first"""
+        with self._lock:
+            rows = [(label, self._self_counts.get(label, 0), total) for label, total in self._total_counts.items()]
+        return sorted(rows, key=lambda row: (row[1], row[2]), reverse=True)[:limit]
+
+monitor = PipelineMonitor()
+profiler = SamplingProfiler()
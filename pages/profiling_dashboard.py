@@ -0,0 +1,101 @@
+# =======================================================
+# Admin page: live sessions, in-flight calls, queues and rerun profiling
+# =======================================================
+import hmac
+import os
+import time
+
+import altair as alt
+import streamlit as st
+
+from monitor import RERUN_BUCKETS, bucket_label, monitor, profiler
+from scheduler import scheduler
+from telemetry import recorder
+
+REFRESH_SECONDS = 2
+
+st.set_page_config(page_title="Pipeline Profiling", layout="wide")
+st.title("📈 Pipeline Profiling")
+
+# ========== Access Control ==========
+def admin_token() -> str:
+    """Token from SF_ADMIN_TOKEN or [admin] token in secrets; the page stays closed without one"""
+    try:
+        return os.environ.get("SF_ADMIN_TOKEN") or st.secrets["admin"]["token"]
+    except Exception:
+        return ""
+
+token = admin_token()
+if not token:
+    st.info("The profiling dashboard is disabled. Set `SF_ADMIN_TOKEN` or `[admin] token` in secrets to enable it.")
+    st.stop()
+if not hmac.compare_digest(st.text_input("Admin token", type="password").encode(), token.encode()):
+    st.stop()
+
+# ========== Sampling Profiler ==========
+profiling = st.toggle("Run sampling profiler on script runs and scheduler workers", value=profiler.running)
+if profiling and not profiler.running:
+    profiler.start()
+elif not profiling and profiler.running:
+    profiler.stop()
+
+# ========== Live View ==========
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_view():
+    sessions, queues, in_flight = monitor.sessions(), scheduler.snapshot(), recorder.in_flight()
+    searches = in_flight.get("search", 0)
+    cols = st.columns(5)
+    cols[0].metric("Live sessions", len(sessions))
+    cols[1].metric("Generating sessions", f"{queues['active_sessions']}/{queues['max_active_sessions']}")
+    cols[2].metric("In-flight LLM calls", sum(in_flight.values()) - searches)
+    cols[3].metric("In-flight searches", searches)
+    cols[4].metric("Busy workers / queued", f"{queues['busy']}/{queues['max_workers']} · {queues['queued']}")
+
+    now = time.time()
+    st.subheader("Sessions")
+    rows = []
+    for session_id, info in sorted(sessions.items(), key=lambda item: item[1]["started"]):
+        queue = queues["sessions"].get(session_id, {})
+        rows.append({"session": session_id[:8], "topic": info["topic"], "step": info["step"], "script runs": info["runs"],
+                     "running tasks": queue.get("running", 0), "queued tasks": queue.get("queued", 0),
+                     "age (s)": round(now - info["started"]), "last seen (s)": round(now - info["last_seen"])})
+    if rows:
+        st.dataframe(rows, use_container_width=True)
+    else:
+        st.caption("No live sessions.")
+    if queues["waiting"]:
+        st.caption("Waiting for admission: " + ", ".join(f"#{w['position']} {w['session_id'][:8]}" for w in queues["waiting"]))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("In-flight calls")
+        if in_flight:
+            st.dataframe([{"call type": t, "in flight": n} for t, n in sorted(in_flight.items())], use_container_width=True)
+        else:
+            st.caption("Nothing in flight.")
+    with col2:
+        st.subheader("Call latency (all time)")
+        stats = recorder.stats()
+        if stats:
+            st.dataframe([{"call type": t, "calls": s["count"], "mean latency (s)": round(s["latency"], 2), "mean tokens in/out": f"{s['prompt_tokens']:.0f}/{s['completion_tokens']:.0f}"}
+                          for t, s in sorted(stats.items())], use_container_width=True)
+        else:
+            st.caption("No calls recorded yet.")
+
+    st.subheader("Script run durations")
+    histograms = monitor.histograms()
+    if histograms:
+        labels = [bucket_label(i) for i in range(len(RERUN_BUCKETS) + 1)]
+        totals = [{"duration": label, "script runs": sum(h[label] for h in histograms.values())} for label in labels]
+        # Keep the buckets in duration order rather than alphabetical
+        st.altair_chart(alt.Chart(alt.Data(values=totals)).mark_bar().encode(x=alt.X("duration:N", sort=None), y="script runs:Q"), use_container_width=True)
+        st.dataframe([{"step": step, **counts} for step, counts in sorted(histograms.items())], use_container_width=True)
+    else:
+        st.caption("No script runs recorded yet.")
+
+    if profiler.samples:
+        st.subheader(f"Profile: {profiler.samples} samples since {time.strftime('%H:%M:%S', time.localtime(profiler.started_at))}" + ("" if profiler.running else " (stopped)"))
+        st.dataframe([{"function": label, "self %": round(100 * own / profiler.samples, 1), "total %": round(100 * total / profiler.samples, 1)}
+                      for label, own, total in profiler.top()], use_container_width=True)
+
+live_view()
@@ -0,0 +1,137 @@
+# =======================================================
+# Process-wide fair scheduler for LLM and search calls
+# =======================================================
+import concurrent.futures
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+MAX_WORKERS = int(os.environ.get("SF_SCHEDULER_WORKERS", "16"))
+MAX_ACTIVE_SESSIONS = int(os.environ.get("SF_MAX_ACTIVE_SESSIONS", "4"))
+# Seconds without a heartbeat after which a session loses its slot or its place in line
+ACTIVE_LEASE_SECONDS = 600
+WAITING_LEASE_SECONDS = 30
+
+class FairScheduler:
+    """Fixed pool of worker threads shared by every session.
+
+    Each session has its own FIFO queue and idle workers take tasks from the sessions
+    round-robin, so one session with many pending calls cannot starve the others.
+    Admission control caps how many sessions generate at once; the rest wait in line.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_active_sessions: int = MAX_ACTIVE_SESSIONS):
+        self.max_workers = max_workers
+        self.max_active_sessions = max_active_sessions
+        self._cond = threading.Condition()
+        self._queues = {}  # session_id -> deque of (future, fn, args, kwargs)
+        self._ready = deque()  # sessions with queued tasks, in round-robin order
+        self._running = {}  # session_id -> tasks currently on a worker
+        self._active = OrderedDict()  # admitted session_id -> last heartbeat
+        self._waiting = OrderedDict()  # session_id waiting for admission -> last heartbeat
+        self._workers = []
+
+    def submit(self, session_id: str, fn, *args, **kwargs) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        with self._cond:
+            # Workers are started on first use so importing this module stays cheap
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"sf-scheduler-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            queue = self._queues.setdefault(session_id, deque())
+            if not queue:
+                self._ready.append(session_id)
+            queue.append((future, fn, args, kwargs))
+            if session_id in self._active:
+                self._active[session_id] = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def _next_task(self):
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            session_id = self._ready.popleft()
+            queue = self._queues[session_id]
+            task = queue.popleft()
+            if queue: self._ready.append(session_id)
+            else: del self._queues[session_id]
+            self._running[session_id] = self._running.get(session_id, 0) + 1
+            return session_id, task
+
+    def _work(self):
+        while True:
+            session_id, (future, fn, args, kwargs) = self._next_task()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try: future.set_result(fn(*args, **kwargs))
+                    except BaseException as exc: future.set_exception(exc)
+            finally:
+                with self._cond:
+                    self._running[session_id] -= 1
+                    if not self._running[session_id]: del self._running[session_id]
+
+    def _expire(self, now: float):
+        for sessions, lease in ((self._active, ACTIVE_LEASE_SECONDS), (self._waiting, WAITING_LEASE_SECONDS)):
+            for session_id in [s for s, seen in sessions.items() if now - seen > lease]:
+                del sessions[session_id]
+
+    def admit(self, session_id: str) -> int:
+        """Return 0 once `session_id` holds a generation slot, otherwise its 1-based place in line.
+
+        Waiting sessions must keep calling this to hold their place.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._expire(now)
+            if session_id in self._active:
+                self._active[session_id] = now
+                return 0
+            # Re-assigning an existing key keeps its place in the OrderedDict
+            self._waiting[session_id] = now
+            position = list(self._waiting).index(session_id)
+            if position < self.max_active_sessions - len(self._active):
+                del self._waiting[session_id]
+                self._active[session_id] = now
+                return 0
+            return position + 1
+
+    def release(self, session_id: str):
+        """Give up the session's slot and cancel its tasks that have not started yet"""
+        with self._cond:
+            self._active.pop(session_id, None)
+            self._waiting.pop(session_id, None)
+            queue = self._queues.pop(session_id, None)
+            if queue:
+                self._ready.remove(session_id)
+                for future, *_ in queue:
+                    future.cancel()
+
+    def queued(self, session_id: str = None) -> int:
+        """Tasks waiting for a worker, for one session or for all of them"""
+        with self._cond:
+            if session_id is not None:
+                return len(self._queues.get(session_id, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def saturated(self) -> bool:
+        """True when every worker is busy, so newly queued tasks really have to wait"""
+        with self._cond:
+            return sum(self._running.values()) >= self.max_workers
+
+    def snapshot(self) -> dict:
+        """Point-in-time view of workers, per-session queues and admission state"""
+        now = time.monotonic()
+        with self._cond:
+            sessions = set(self._queues) | set(self._running) | set(self._active)
+            return {
+                "workers": len(self._workers), "max_workers": self.max_workers, "busy": sum(self._running.values()),
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "active_sessions": len(self._active), "max_active_sessions": self.max_active_sessions,
+                "sessions": {s: {"queued": len(self._queues.get(s, ())), "running": self._running.get(s, 0), "admitted": s in self._active} for s in sessions},
+                "waiting": [{"session_id": s, "position": i + 1, "seconds_since_poll": round(now - seen, 1)} for i, (s, seen) in enumerate(self._waiting.items())],
+            }
+
+scheduler = FairScheduler()
@@ -0,0 +1,104 @@
+# =======================================================
+# Cold-start profiler for the app and the evaluation scripts
+# =======================================================
+# Each target is measured in a fresh interpreter so nothing is already imported.
+# Exits with status 1 when a target exceeds its cold-start budget or fails its first use.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds allowed for import + first render of each target; benchmark_eval's first
+# evaluation loads nltk's tokenizer and the cmudict syllable dictionary
+STARTUP_BUDGET_SECONDS = {"app": 3.0, "benchmark_eval": 2.0, "llm_eval": 0.5}
+# Modules that should only be loaded once they are actually needed
+LAZY_MODULES = ["openai", "tavily", "nltk", "textstat", "numpy"]
+
+_APP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit, ap_renderer, data_model, estimator, monitor, scheduler, telemetry, templates
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py")
+t2 = time.perf_counter()
+at.run(timeout=60)
+t3 = time.perf_counter()
+error = str(at.exception[0].value) if at.exception else None
+print(json.dumps({"import": t1 - t0, "first_render": t3 - t2, "error": error, "loaded": sorted(m for m in %r if m in sys.modules)}))
+"""
+
+_EVAL_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import %(module)s
+t1 = time.perf_counter()
+error = None
+%(first_use)s
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_render": t2 - t1, "error": error, "loaded": sorted(m for m in %(lazy)r if m in sys.modules)}))
+"""
+
+_FIRST_EVALUATION = """try:
+    benchmark_eval.evaluate_text(json.load(open("samples/drone_0.json"))[0]["story"])
+except Exception as e:
+    error = "first evaluation failed: " + next((l.strip() for l in str(e).splitlines() if l.strip(" *")), type(e).__name__)
+"""
+
+def _probe_code(target: str) -> str:
+    if target == "app":
+        return _APP_PROBE % (LAZY_MODULES,)
+    first_use = _FIRST_EVALUATION if target == "benchmark_eval" else "pass"
+    return _EVAL_PROBE % {"module": target, "first_use": first_use, "lazy": LAZY_MODULES}
+
+def _heaviest_imports(importtime_log: str, limit: int) -> list:
+    """Parse `python -X importtime` output into the slowest top-level imports"""
+    entries = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            entries.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(entries, key=lambda e: e[1], reverse=True)[:limit]
+
+def profile_target(target: str, top: int = 5) -> dict:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _probe_code(target)], cwd=ROOT, capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"target": target, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "probe failed"}
+    result = json.loads(lines[-1])
+    result.update(target=target, total=result["import"] + result["first_render"], budget=STARTUP_BUDGET_SECONDS[target], heaviest_imports=_heaviest_imports(proc.stderr, top))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import and first-render times")
+    parser.add_argument("targets", nargs="*", help=f"Targets to profile: {', '.join(STARTUP_BUDGET_SECONDS)} (default: all)")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(STARTUP_BUDGET_SECONDS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    results = [profile_target(t) for t in args.targets or STARTUP_BUDGET_SECONDS]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "total" not in r:
+                print(f"{r['target']}: ERROR {r['error']}")
+                continue
+            status = "FAILED" if r.get("error") else "OK" if r["total"] <= r["budget"] else "OVER BUDGET"
+            print(f"{r['target']}: import {r['import']:.3f}s + first render {r['first_render']:.3f}s = {r['total']:.3f}s (budget {r['budget']:.1f}s) {status}")
+            print(f"  heavy modules loaded: {', '.join(r['loaded']) or 'none'}")
+            print(f"  slowest imports: {', '.join(f'{name} {secs:.3f}s' for name, secs in r['heaviest_imports'])}")
+            if r.get("error"):
+                print(f"  error: {r['error']}")
+    # A probe whose first use failed took a shortcut, so its timing proves nothing either
+    sys.exit(0 if all(not r.get("error") and r["total"] <= r["budget"] for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
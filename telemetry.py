@@ -0,0 +1,98 @@
+# =======================================================
+# Per-call telemetry for LLM and web search calls
+# =======================================================
+import json
+import os
+import threading
+import time
+
+TELEMETRY_PATH = os.environ.get("SF_TELEMETRY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry", "calls.jsonl"))
+
+class TelemetryRecorder:
+    """Appends one JSON line per call and keeps running per-call-type aggregates in memory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._aggregates = None
+        self._in_flight = {}
+
+    def _load(self):
+        # call_type -> [count, prompt_tokens, completion_tokens, latency_seconds]
+        aggregates = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._add(aggregates, entry)
+        self._aggregates = aggregates
+
+    @staticmethod
+    def _add(aggregates: dict, entry: dict):
+        totals = aggregates.setdefault(entry["call_type"], [0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += entry.get("prompt_tokens", 0)
+        totals[2] += entry.get("completion_tokens", 0)
+        totals[3] += entry.get("latency", 0.0)
+
+    def record(self, call_type: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+        entry = {"call_type": call_type, "latency": round(latency, 3), "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "ts": round(time.time(), 3)}
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                pass  # Telemetry must never break a generation run
+            if self._aggregates is not None:
+                self._add(self._aggregates, entry)
+
+    def begin(self, call_type: str):
+        with self._lock:
+            self._in_flight[call_type] = self._in_flight.get(call_type, 0) + 1
+
+    def end(self, call_type: str):
+        with self._lock:
+            self._in_flight[call_type] -= 1
+
+    def in_flight(self) -> dict:
+        """Return {call_type: calls currently waiting on the API}"""
+        with self._lock:
+            return {call_type: n for call_type, n in self._in_flight.items() if n}
+
+    def stats(self) -> dict:
+        """Return {call_type: {"count", "prompt_tokens", "completion_tokens", "latency"}} with per-call means"""
+        with self._lock:
+            if self._aggregates is None:
+                self._load()
+            return {
+                call_type: {"count": count, "prompt_tokens": prompt / count, "completion_tokens": completion / count, "latency": latency / count}
+                for call_type, (count, prompt, completion, latency) in self._aggregates.items()
+            }
+
+recorder = TelemetryRecorder(TELEMETRY_PATH)
+
+def chat_completion(client, call_type: str, **kwargs):
+    """client.chat.completions.create with latency and token usage recorded under `call_type`"""
+    start = time.perf_counter()
+    recorder.begin(call_type)
+    try:
+        response = client.chat.completions.create(**kwargs)
+    finally:
+        recorder.end(call_type)
+    usage = getattr(response, "usage", None)
+    recorder.record(call_type, time.perf_counter() - start, getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
+    return response
+
+def web_search(tavily_client, call_type: str, **kwargs):
+    start = time.perf_counter()
+    recorder.begin(call_type)
+    try:
+        response = tavily_client.search(**kwargs)
+    finally:
+        recorder.end(call_type)
+    recorder.record(call_type, time.perf_counter() - start)
+    return response